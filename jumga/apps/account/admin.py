@@ -49,7 +49,9 @@ class MerchantAdmin(admin.ModelAdmin):
 
 @admin.register(Rider)
 class RiderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'first_name', 'last_name', 'phone_number',)
+    list_display = ('id', 'user', 'first_name', 'last_name', 'phone_number',
+                    'country', 'active_shop_count',)
+    list_filter = ('country',)
 
 
 @admin.register(Country)
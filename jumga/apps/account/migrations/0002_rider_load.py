@@ -0,0 +1,32 @@
+# Generated by Django 3.1.4 on 2026-10-18 13:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rider',
+            name='active_shop_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rider',
+            name='country',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='account.country'),
+        ),
+        migrations.AddIndex(
+            model_name='rider',
+            index=models.Index(fields=['active_shop_count', 'id'], name='rider_load_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rider',
+            index=models.Index(fields=['country', 'active_shop_count', 'id'], name='rider_country_load_idx'),
+        ),
+    ]
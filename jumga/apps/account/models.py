@@ -96,6 +96,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     bank_account_name = models.CharField(max_length=150, blank=True)
     bank_account_number = models.CharField(max_length=150, blank=True)
 
+    # In the currency of the user's merchant or rider country, kept by
+    # the merchant ledger. Other currencies are only in ledger.balances().
     account_balance = models.DecimalField(
         max_digits=20, decimal_places=2, default=0.00)
 
@@ -180,8 +182,21 @@ class Rider(models.Model):
     phone_number = CharNullField(
         max_length=18, unique=True, blank=True, null=True, default=None)
 
+    country = models.ForeignKey(
+        Country, on_delete=models.SET_NULL, blank=True, null=True)
+
+    # Active shops this rider delivers for, kept up to date by the
+    # merchant app so the least loaded rider is one index lookup away.
+    active_shop_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         db_table = 'rider'
+        indexes = [
+            models.Index(fields=['active_shop_count', 'id'],
+                         name='rider_load_idx'),
+            models.Index(fields=['country', 'active_shop_count', 'id'],
+                         name='rider_country_load_idx'),
+        ]
 
     def __str__(self):
         return self.user.email
@@ -46,6 +46,19 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
                 {'detail': 'No active account found with the given credentials'})
 
 
+class UserSerializer(serializers.ModelSerializer):
+    """
+    Public view of a user account, without the password hash or the
+    group and permission relations.
+    """
+
+    class Meta:
+        model = User
+        fields = ['id', 'email', 'username', 'is_active', 'bank_name',
+                  'bank_account_name', 'bank_account_number',
+                  'account_balance', 'date_joined', 'last_login']
+
+
 class MerchantSerializer(serializers.ModelSerializer):
 
     class Meta:
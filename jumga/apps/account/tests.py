@@ -1,3 +1,52 @@
-from django.test import TestCase
+from decimal import Decimal as D
 
-# Create your tests here.
+from django.urls import reverse
+
+from jumga.apps.merchant.ledger import balances, drain, recount_balances
+from jumga.apps.merchant.tests import MerchantTestCase
+from .models import User
+
+
+class AccountBalanceTests(MerchantTestCase):
+    """
+    account_balance only counts the user's own currency, a USD approval
+    fee and an NGN sale never end up in the same figure.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.pay()
+        self.pay(self.create_order([{'id': self.apple.id, 'quantity': 3},
+                                    {'id': self.pear.id, 'quantity': 1}]))
+        drain()
+
+    def account_balances(self):
+        return dict(User.objects.values_list('email', 'account_balance'))
+
+    def test_balances_are_kept_in_the_users_currency(self):
+        self.assertEqual(self.account_balances(), {
+            self.platform.email: D('0.00'),
+            'merchant@example.com': D('326.29'),
+            'rider@example.com': D('16.00'),
+        })
+        self.assertEqual(
+            {currency: total['balance']
+             for currency, total in balances(self.platform.id).items()},
+            {'USD': D('20.00'), 'NGN': D('12.71')})
+
+    def test_recount_matches_the_incremental_balances(self):
+        kept = self.account_balances()
+        User.objects.update(account_balance=D('120.81'))
+
+        self.assertEqual(recount_balances(), 3)
+        self.assertEqual(self.account_balances(), kept)
+
+    def test_balance_view_names_the_currency(self):
+        response = self.client.get(reverse('balance', args=[self.merchant.user_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['account_currency'], 'NGN')
+        self.assertEqual(D(str(response.json()['account_balance'])), D('326.29'))
+
+        response = self.client.get(reverse('balance', args=[self.platform.id]))
+        self.assertIsNone(response.json()['account_currency'])
+        self.assertEqual(set(response.json()['currencies']), {'USD', 'NGN'})
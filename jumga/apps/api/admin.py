@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import IdempotencyKey
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('id', 'key', 'status_code', 'created_at', )
+    search_fields = ('key', )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from jumga.idempotency import DatabaseBackend
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored Idempotency-Key responses older than IDEMPOTENCY_TTL.'
+
+    def handle(self, *args, **options):
+        deleted = DatabaseBackend(settings.IDEMPOTENCY_TTL).purge()
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted %s expired idempotency keys' % deleted))
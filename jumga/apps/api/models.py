@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response stored for an Idempotency-Key when IDEMPOTENCY_BACKEND is
+    'database'. status_code stays null while the first request holding
+    the key is still running.
+    """
+    key = models.CharField(max_length=320, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    content = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_key'
+
+    def __str__(self):
+        return self.key
@@ -1,3 +1,207 @@
-from django.test import TestCase
+from decimal import Decimal as D
 
-# Create your tests here.
+from django.test import override_settings
+from django.urls import reverse
+
+from jumga.apps.account.models import Merchant, User
+from jumga.apps.merchant.models import (LedgerOutbox, Notification, Order, Payment, Product,
+                                        Shop, WebhookEvent)
+from jumga.apps.merchant.tests import MerchantTestCase
+from jumga.apps.merchant.webhooks import drain_inbox
+from jumga.idempotency import get_backend
+
+
+class IdempotencyTests(MerchantTestCase):
+
+    def post_order(self, key=None, quantity=1):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('merchant_order'),
+            self.order_data([{'id': self.apple.id, 'quantity': quantity}]),
+            content_type='application/json', **headers)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post_order('checkout-1')
+        retry = self.post_order('checkout-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_BACKEND='database')
+    def test_retry_replays_from_the_database(self):
+        first = self.post_order('checkout-1')
+        retry = self.post_order('checkout-1')
+
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_another_body_is_unprocessable(self):
+        self.post_order('checkout-1')
+        response = self.post_order('checkout-1', quantity=2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_while_the_first_request_runs_conflicts(self):
+        get_backend().begin('OrderView:checkout-1', 'fingerprint')
+        response = self.post_order('checkout-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_keys_are_per_endpoint(self):
+        self.post_order('checkout-1')
+        response = self.client.post(
+            reverse('merchant_payment'), {}, content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.post_order()
+        self.post_order()
+        self.assertEqual(Order.objects.count(), 2)
+
+
+@override_settings(FLUTTERWAVE_SECRET_HASH='dashboard-secret')
+class FlutterwaveWebhookTests(MerchantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order([{'id': self.apple.id, 'quantity': 2}])
+
+    def payload(self, id='1001', **data):
+        return {'event': 'charge.completed', 'data': dict({
+            'id': id, 'flw_ref': 'FLW-%s' % id, 'tx_ref': self.order.reference_id,
+            'amount': '220.00', 'currency': 'NGN', 'status': 'successful',
+            'meta': {'order': self.order.id},
+        }, **data)}
+
+    def deliver(self, payload, signature='dashboard-secret'):
+        return self.client.post(
+            reverse('flutterwave_webhook'), payload,
+            content_type='application/json', HTTP_VERIF_HASH=signature)
+
+    def test_wrong_or_missing_signature_is_refused(self):
+        self.assertEqual(self.deliver(self.payload(), 'guess').status_code, 401)
+        self.assertEqual(self.deliver(self.payload(), '').status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    @override_settings(FLUTTERWAVE_SECRET_HASH='')
+    def test_nothing_is_accepted_without_a_configured_secret(self):
+        self.assertEqual(self.deliver(self.payload(), '').status_code, 401)
+
+    def test_event_without_references_is_rejected(self):
+        self.assertEqual(self.deliver({'event': 'charge.completed'}).status_code, 400)
+
+    def test_redeliveries_are_stored_once(self):
+        self.assertEqual(self.deliver(self.payload()).status_code, 200)
+        self.assertEqual(self.deliver(self.payload()).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+        self.assertEqual(drain_inbox(), (1, 0))
+        payment = Payment.objects.get()
+        self.assertEqual((payment.transaction_id, payment.amount, payment.payment_type),
+                         ('1001', D('220.00'), Payment.SALE))
+        self.assertTrue(LedgerOutbox.objects.filter(payment=payment).exists())
+        self.assertEqual(WebhookEvent.objects.get().payment, payment)
+
+    def test_payment_already_posted_is_kept(self):
+        self.pay(self.order, transaction_id='1001', tx_ref=self.order.reference_id)
+        self.deliver(self.payload())
+
+        self.assertEqual(drain_inbox(), (1, 0))
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_events_that_make_no_payment_are_recorded(self):
+        for payload in (self.payload('1', amount='100.00'),
+                        self.payload('2', amount='NaN'),
+                        self.payload('3', currency='EUR'),
+                        self.payload('4', status='failed')):
+            self.deliver(payload)
+
+        self.assertEqual(drain_inbox(), (0, 4))
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(
+            dict(WebhookEvent.objects.values_list('transaction_id', 'error')), {
+                '1': 'Amount 100.00 is less than the order total 220.00.',
+                '2': 'Invalid amount NaN.',
+                '3': 'Unsupported currency EUR.',
+                '4': 'Charge status is failed.',
+            })
+
+
+class OrderStatusTransitionTests(MerchantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.standing = self.create_order([{'id': self.apple.id, 'quantity': 1}])
+        self.paid = self.create_order([{'id': self.apple.id, 'quantity': 1}])
+        self.delivered = self.create_order([{'id': self.apple.id, 'quantity': 1}])
+        Order.objects.filter(id=self.paid.id).update(status=Order.PAYMENT_MADE)
+        Order.objects.filter(id=self.delivered.id).update(status=Order.DELIVERED)
+
+        other = Merchant.objects.create(
+            user=User.objects.create_user('other@example.com', 'password'),
+            country=self.country)
+        other_shop = Shop.objects.create(user=other, name='Other Shop', delivery_fee=10)
+        self.others = self.create_order(
+            [{'id': Product.objects.create(shop=other_shop, name='Fig', price=5).id,
+              'quantity': 1}], shop=other_shop.id)
+        Order.objects.filter(id=self.others.id).update(status=Order.PAYMENT_MADE)
+
+    def move(self, url, user_id, ids, status):
+        return self.client.patch(
+            reverse(url, args=[user_id]), {'ids': ids, 'status': status},
+            content_type='application/json')
+
+    def statuses(self):
+        return dict(Order.objects.values_list('id', 'status'))
+
+    def test_merchant_delivers_only_paid_orders_of_their_shops(self):
+        ids = [self.standing.id, self.paid.id, self.delivered.id, self.others.id]
+        response = self.move('merchant_orders_status', self.merchant.user_id,
+                             ids, Order.DELIVERED)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'updated': [self.paid.id],
+            'rejected': sorted([self.standing.id, self.delivered.id, self.others.id])})
+        self.assertEqual(self.statuses(), {
+            self.standing.id: Order.STANDING, self.paid.id: Order.DELIVERED,
+            self.delivered.id: Order.DELIVERED, self.others.id: Order.PAYMENT_MADE})
+        self.assertTrue(Notification.objects.filter(
+            order=self.paid, event=Notification.ORDER_DELIVERED).exists())
+
+    def test_merchant_cancels_open_orders(self):
+        ids = [self.standing.id, self.paid.id, self.delivered.id]
+        response = self.move('merchant_orders_status', self.merchant.user_id,
+                             ids, Order.CANCELLED)
+
+        self.assertEqual(response.json(), {
+            'updated': sorted([self.standing.id, self.paid.id]),
+            'rejected': [self.delivered.id]})
+        self.assertFalse(Notification.objects.filter(
+            event=Notification.ORDER_DELIVERED).exists())
+
+    def test_payment_cannot_be_set_by_hand(self):
+        response = self.move('merchant_orders_status', self.merchant.user_id,
+                             [self.standing.id], Order.PAYMENT_MADE)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses()[self.standing.id], Order.STANDING)
+
+    def test_rider_delivers_orders_of_the_shops_they_serve(self):
+        response = self.move('rider_orders_status', self.rider.user_id,
+                             [self.paid.id, self.others.id], Order.DELIVERED)
+
+        self.assertEqual(response.json(), {
+            'updated': [self.paid.id], 'rejected': [self.others.id]})
+
+    def test_rider_cannot_cancel(self):
+        response = self.move('rider_orders_status', self.rider.user_id,
+                             [self.paid.id], Order.CANCELLED)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses()[self.paid.id], Order.PAYMENT_MADE)
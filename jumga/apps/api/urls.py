@@ -11,6 +11,7 @@ VER_ = 'v1'
 account = 'auth'
 merchant = 'merchant'
 customer = 'customer'
+rider = 'rider'
 admin = 'admin'
 
 urlpatterns = [
@@ -75,9 +76,31 @@ urlpatterns = [
     path(f'{VER_}/{merchant}/shop/products/<int:shop_id>/all/',
          merchant_views.ProductListView.as_view(), name='merchant_all_shop_products'),
 
+    path(f'{VER_}/{merchant}/shop/products/<int:shop_id>/import/',
+         merchant_views.ProductImportView.as_view(), name='merchant_shop_products_import'),
+
+    path(f'{VER_}/{merchant}/shop/products/<int:shop_id>/bulk/',
+         merchant_views.ProductBulkUpdateView.as_view(), name='merchant_shop_products_bulk_update'),
+
     path(f'{VER_}/{merchant}/shop/products/<slug:shop_slug>/all/public/',
          merchant_views.ShopAndProductsView.as_view(), name='all_shop_and_products_public'),
 
+    # Storefront of <sub_domain>.SHOP_ROOT_DOMAIN
+    path(f'{VER_}/storefront/',
+         merchant_views.HostShopAndProductsView.as_view(), name='host_shop_and_products_public'),
+
+    path(f'{VER_}/{merchant}/uploads/',
+         merchant_views.UploadURLView.as_view(), name='merchant_upload_url'),
+
+    path(f'{VER_}/{merchant}/uploads/confirm/',
+         merchant_views.UploadConfirmView.as_view(), name='merchant_upload_confirm'),
+
+    path(f'{VER_}/uploads/local/',
+         merchant_views.LocalMediaUploadView.as_view(), name='media_upload_local'),
+
+    path(f'{VER_}/webhooks/flutterwave/',
+         merchant_views.FlutterwaveWebhookView.as_view(), name='flutterwave_webhook'),
+
     path(f'{VER_}/{merchant}/payment/',
          merchant_views.PaymentView.as_view(), name='merchant_payment'),
 
@@ -87,9 +110,30 @@ urlpatterns = [
     path(f'{VER_}/{merchant}/allorders/<uuid:id>/',
          merchant_views.MerchantOrdersView.as_view(), name='merchant_all_orders'),
 
+    path(f'{VER_}/{merchant}/allorders/<uuid:id>/status/',
+         merchant_views.OrderStatusTransitionView.as_view(), name='merchant_orders_status'),
+
+    path(f'{VER_}/{rider}/orders/<uuid:id>/status/',
+         merchant_views.RiderOrderStatusTransitionView.as_view(), name='rider_orders_status'),
+
+    path(f'{VER_}/{merchant}/allorders/<uuid:id>/export/',
+         merchant_views.MerchantOrdersExportView.as_view(), name='merchant_orders_export'),
+
     path(f'{VER_}/{merchant}/overview/<uuid:id>/',
          merchant_views.OverviewView.as_view(), name='overview'),
 
+    path(f'{VER_}/{merchant}/balance/<uuid:id>/',
+         merchant_views.BalanceView.as_view(), name='balance'),
+
+    path(f'{VER_}/{merchant}/statement/<uuid:id>/',
+         merchant_views.StatementView.as_view(), name='statement'),
+
+
+    path(f'{VER_}/{customer}/products/search/',
+         merchant_views.ProductSearchView.as_view(), name='product_search'),
+
+    path(f'{VER_}/{customer}/cart/quote/',
+         merchant_views.CartQuoteView.as_view(), name='cart_quote'),
 
     path(f'{VER_}/{customer}/orders/<str:email>/<str:contact>/',
          merchant_views.CustomersOrderView.as_view(), name='customer_orders'),
@@ -98,6 +142,15 @@ urlpatterns = [
     path(f'{VER_}/{admin}/transactions/',
          merchant_views.TransactionView.as_view(), name='transactions'),
 
+    path(f'{VER_}/{admin}/transactions/archive/',
+         merchant_views.ArchivedTransactionsView.as_view(), name='archived_transactions'),
+
+    path(f'{VER_}/{admin}/transactions/archive/<int:id>/',
+         merchant_views.ArchivedTransactionsDetailView.as_view(), name='archived_transactions_detail'),
+
+    path(f'{VER_}/{admin}/transactions/export/',
+         merchant_views.TransactionExportView.as_view(), name='transactions_export'),
+
     path(f'{VER_}/{admin}/allorders/',
          merchant_views.AllOrdersView.as_view(), name='all_orders'),
 
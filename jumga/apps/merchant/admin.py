@@ -3,7 +3,8 @@ from django.contrib import admin
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
-from .models import Shop, ShopCategory, Product, Order, OrderedItem, Transaction, Payment
+from .models import Shop, ShopCategory, Product, Order, OrderedItem, Transaction, Payment, Notification, ArchivedPartition, LedgerOutbox, LedgerDailyRollup, WebhookEvent
+from .riders import reassign_riders
 # from django.conf import settings
 
 User = get_user_model()
@@ -13,6 +14,12 @@ User = get_user_model()
 class ShopAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'rider', 'name', 'description', 'sub_domain', 'delivery_fee',
                     'logo', 'banner_image', 'is_active', 'updated_at', 'created_at', )
+    actions = ['reassign_riders']
+
+    def reassign_riders(self, request, queryset):
+        assigned = reassign_riders(queryset.values_list('id', flat=True))
+        self.message_user(request, _('Assigned riders to %s shops.') % len(assigned))
+    reassign_riders.short_description = _('Reassign riders')
 
 
 @admin.register(ShopCategory)
@@ -60,3 +67,47 @@ class TransactionAdmin(admin.ModelAdmin):
                     'transaction_id', 'transaction_type',
                     'tx_ref_from_payment', 'narration',
                     'updated_at', 'created_at', )
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipient', 'order', 'event', 'sent_at',
+                    'created_at', )
+    list_filter = ('event', )
+
+
+@admin.register(ArchivedPartition)
+class ArchivedPartitionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'table_name', 'period', 'row_count', 'file',
+                    'created_at', )
+
+
+@admin.register(LedgerOutbox)
+class LedgerOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payment', 'attempts', 'last_error',
+                    'next_attempt_at', 'processed_at', 'created_at', )
+    list_select_related = ('payment', )
+    actions = ['retry_postings']
+
+    def retry_postings(self, request, queryset):
+        retried = queryset.filter(processed_at__isnull=True).update(
+            attempts=0, last_error='', next_attempt_at=None)
+        self.message_user(request, _('%s postings queued again.') % retried)
+    retry_postings.short_description = _('Retry selected postings')
+
+
+@admin.register(LedgerDailyRollup)
+class LedgerDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'day', 'currency', 'credit', 'debit',
+                    'entries', )
+    list_filter = ('currency', )
+    list_select_related = ('user', )
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event', 'transaction_id', 'flw_ref', 'payment',
+                    'error', 'processed_at', 'created_at', )
+    list_filter = ('event', )
+    search_fields = ('transaction_id', 'flw_ref', )
+    list_select_related = ('payment', )
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db import transaction
+
+from jumga.cache import TieredCache
+
+# Rendered ShopAndProductsView payloads keyed by shop sub_domain.
+storefronts = TieredCache('storefront', maxsize=512, local_ttl=5)
+
+# Shop id keyed by sub_domain, for the host based routing. Unknown
+# sub_domains are cached as 0.
+shop_hosts = TieredCache('shophost', maxsize=4096, local_ttl=10)
+
+# {'delivery_fee': Decimal, 'version': str} of a shop, keyed by shop id,
+# for cart quotes. A new version is drawn whenever the entry is rebuilt,
+# which retires every cached price of the shop at once.
+shop_quotes = TieredCache('shopquote', maxsize=1024, local_ttl=5)
+
+# (name, price) of a product on sale, or 0 if it isn't, keyed by
+# product_price_key(). Prices are cached one product at a time so a big
+# catalog never has to fit in a single cache entry.
+product_prices = TieredCache('productprice', maxsize=50000, local_ttl=5)
+
+# Id of the platform account keyed by its email, for ledger postings.
+platform_accounts = TieredCache('platformaccount', maxsize=8, local_ttl=60)
+
+
+def invalidate_storefronts(*sub_domains):
+    """
+    Drops the storefront snapshots once the current transaction commits,
+    so a concurrent reader can't rebuild a snapshot from stale rows.
+    """
+    sub_domains = [sub_domain for sub_domain in sub_domains if sub_domain]
+    if sub_domains:
+        transaction.on_commit(lambda: storefronts.delete(*sub_domains))
+
+
+def invalidate_shop_hosts(*sub_domains):
+    sub_domains = [sub_domain for sub_domain in sub_domains if sub_domain]
+    if sub_domains:
+        transaction.on_commit(lambda: shop_hosts.delete(*sub_domains))
+
+
+def product_price_key(shop_id, version, product_id):
+    return '%s:%s:%s' % (shop_id, version, product_id)
+
+
+def invalidate_shop_prices(*shop_ids):
+    """
+    Drops the shop entries, and with them every cached price of those
+    shops. Meant for changes to a shop or to many of its products.
+    """
+    shop_ids = [shop_id for shop_id in shop_ids if shop_id]
+    if shop_ids:
+        transaction.on_commit(lambda: shop_quotes.delete(*shop_ids))
+
+
+def invalidate_product_prices(shop_id, *product_ids):
+    def invalidate():
+        shop = shop_quotes.get(shop_id)
+        if shop is not None:
+            product_prices.delete(*[
+                product_price_key(shop_id, shop['version'], product_id)
+                for product_id in product_ids])
+
+    if shop_id and product_ids:
+        transaction.on_commit(invalidate)
+
+
+def invalidate_platform_account():
+    email = settings.JUMGA_PLATFORM_EMAIL
+    transaction.on_commit(lambda: platform_accounts.delete(email))
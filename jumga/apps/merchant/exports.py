@@ -0,0 +1,135 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CHUNK_SIZE = 2000
+
+# Lines are joined into blocks of about this many bytes before being
+# written, so a big export isn't sent one tiny chunk per row.
+BLOCK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    CSV: 'text/csv',
+    NDJSON: 'application/x-ndjson',
+}
+
+# (column name, values_list path)
+ORDER_COLUMNS = (
+    ('id', 'id'),
+    ('reference_id', 'reference_id'),
+    ('shop_id', 'shop_id'),
+    ('shop_name', 'shop__name'),
+    ('customer_name', 'customer_name'),
+    ('customer_email', 'customer_email'),
+    ('customer_contact', 'customer_contact'),
+    ('customer_city', 'customer_city'),
+    ('status', 'status'),
+    ('paid', 'paid'),
+    ('subtotal', 'subtotal'),
+    ('delivery_fee', 'delivery_fee'),
+    ('total', 'total'),
+    ('created_at', 'created_at'),
+)
+
+TRANSACTION_COLUMNS = (
+    ('id', 'id'),
+    ('transaction_id', 'transaction_id'),
+    ('beneficiary_id', 'beneficiary_id'),
+    ('beneficiary_email', 'beneficiary__email'),
+    ('transaction_type', 'transaction_type'),
+    ('amount', 'amount'),
+    ('currency', 'currency'),
+    ('tx_ref', 'tx_ref_from_payment__tx_ref'),
+    ('narration', 'narration'),
+    ('created_at', 'created_at'),
+)
+
+
+class Echo:
+    """
+    File-like object for csv.writer that hands back what it is given
+    instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """
+    Tuples of the export columns, read in chunks so only one chunk of
+    rows is held in memory at a time.
+    """
+    return queryset.order_by('id').values_list(
+        *[path for _, path in columns]).iterator(chunk_size=chunk_size)
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def blocks(lines, size=BLOCK_SIZE):
+    block = []
+    length = 0
+    for line in lines:
+        block.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(block).encode()
+            block = []
+            length = 0
+    if block:
+        yield ''.join(block).encode()
+
+
+def gzip_blocks(chunks):
+    """
+    Compresses a stream of bytes into one gzip member as it goes.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, columns, type=CSV, compress=False,
+                  chunk_size=CHUNK_SIZE):
+    header = [name for name, _ in columns]
+    rows = export_rows(queryset, columns, chunk_size)
+    lines = ndjson_lines(header, rows) if type == NDJSON else csv_lines(header, rows)
+    chunks = blocks(lines)
+    return gzip_blocks(chunks) if compress else chunks
+
+
+def export_response(queryset, columns, filename, type=CSV, compress=False):
+    """
+    Streams the export as a download; nothing beyond the current chunk
+    of rows is ever held in memory.
+    """
+    filename = '%s.%s' % (filename, type)
+    content_type = CONTENT_TYPES[type]
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+
+    response = StreamingHttpResponse(
+        stream_export(queryset, columns, type, compress),
+        content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
@@ -0,0 +1,87 @@
+import io
+import posixpath
+
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# Longest edge, in pixels, of every derivative we generate.
+DERIVATIVE_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1200,
+}
+
+DERIVATIVE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+QUALITY = 80
+
+
+def derivative_name(name, size, ext):
+    """
+    shop/apple.png -> shop/derivatives/apple_card.webp
+    """
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory, 'derivatives', '%s_%s.%s' % (stem, size, ext))
+
+
+def open_image(name, storage=default_storage):
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha channel, flatten transparent images on white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def generate_derivatives(name, storage=default_storage):
+    """
+    Writes every size/format of the image stored under `name` and returns
+    the stored names as {'source': name, size: {format: name}}.
+    """
+    image = open_image(name, storage)
+    derivatives = {'source': name}
+
+    for size, edge in DERIVATIVE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        derivatives[size] = {}
+
+        for ext, format in DERIVATIVE_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, format, quality=QUALITY)
+            derivatives[size][ext] = storage.save(
+                derivative_name(name, size, ext), ContentFile(buffer.getvalue()))
+
+    return derivatives
+
+
+def derivative_files(derivatives):
+    """
+    Stored names of every derivative in `derivatives`, without the source.
+    """
+    return {
+        name for size, formats in (derivatives or {}).items() if size != 'source'
+        for name in formats.values()
+    }
+
+
+def derivative_urls(derivatives, storage=default_storage):
+    """
+    {'card': {'webp': url, 'jpeg': url}, ...} for the serializers.
+    """
+    return {
+        size: {ext: storage.url(name) for ext, name in formats.items()}
+        for size, formats in (derivatives or {}).items() if size != 'source'
+    }
@@ -0,0 +1,165 @@
+import csv
+import json
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate_storefronts, invalidate_shop_prices
+from .models import Product, ShopCategory, product_slug
+from .search import get_backend as get_search_backend
+from .serializers import ProductImportSerializer
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CHUNK_SIZE = 1000
+
+# Only the first errors are kept in the report, the rest are counted.
+MAX_REPORTED_ERRORS = 500
+
+
+def detect_type(filename):
+    if filename.lower().endswith(('.ndjson', '.jsonl')):
+        return NDJSON
+    return CSV
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def decode_lines(stream):
+    """
+    Decodes a binary stream one line at a time, so a file that isn't
+    UTF-8 can be reported with the line and byte it breaks at.
+    """
+    offset = 0
+    for number, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError as exc:
+            raise ImportFileError(
+                'Line %s is not valid UTF-8, at byte %s.' % (number, offset + exc.start))
+        offset += len(line)
+
+
+def read_rows(stream, type=CSV):
+    """
+    Yields one dict per CSV record / NDJSON line from a binary stream,
+    without reading the whole file into memory. Empty CSV cells are
+    dropped so optional fields fall back to their defaults. Raises
+    ImportFileError at the first line that isn't UTF-8.
+    """
+    text = decode_lines(stream)
+
+    if type == NDJSON:
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+    else:
+        for row in csv.DictReader(text):
+            yield {key: value for key, value in row.items()
+                   if key and value not in ('', None)}
+
+
+class ProductImporter:
+    """
+    Validates and writes products for one shop, a chunk at a time. Each
+    chunk is written with a single bulk_create in its own transaction,
+    so a bad row only costs itself and memory stays bounded by the
+    chunk size.
+    """
+
+    def __init__(self, shop, chunk_size=CHUNK_SIZE):
+        self.shop = shop
+        self.chunk_size = chunk_size
+        # One serializer validates every row, so its fields are only
+        # built once per import.
+        self.serializer = ProductImportSerializer(context={
+            'categories': set(ShopCategory.objects.filter(
+                shop=shop).values_list('id', flat=True))
+        })
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.file_error = None
+
+    def run(self, rows):
+        """
+        Imports the rows and returns the report. If the file turns out
+        to be unreadable part way, the rows read until then are still
+        imported and the report carries the reason under `file`.
+        """
+        last = Product.objects.filter(shop=self.shop).order_by('-id')\
+            .values_list('id', flat=True).first() or 0
+
+        chunk = []
+        try:
+            for row in enumerate(rows, start=1):
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    self.import_chunk(chunk)
+                    chunk = []
+        except ImportFileError as exc:
+            self.file_error = str(exc)
+        if chunk:
+            self.import_chunk(chunk)
+
+        if self.created:
+            get_search_backend().index_queryset(
+                Product.objects.filter(shop=self.shop, id__gt=last))
+            invalidate_storefronts(self.shop.sub_domain)
+            invalidate_shop_prices(self.shop.id)
+
+        return self.report()
+
+    def import_chunk(self, chunk):
+        products = []
+        for number, row in chunk:
+            product = self.build_product(number, row)
+            if product is not None:
+                products.append(product)
+
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+        self.created += len(products)
+
+    def build_product(self, number, row):
+        if not isinstance(row, dict):
+            self.add_error(number, {'non_field_errors': ['Invalid row.']})
+            return None
+
+        try:
+            data = self.serializer.run_validation(row)
+        except ValidationError as exc:
+            self.add_error(number, exc.detail)
+            return None
+
+        return Product(
+            shop=self.shop,
+            name=data['name'],
+            price=data['price'],
+            description=data.get('description', ''),
+            shopcategory_id=data.get('shopcategory'),
+            is_active=data.get('is_active', True),
+            slug=product_slug(data['name']),
+        )
+
+    def add_error(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": number, "errors": errors})
+
+    def report(self):
+        report = {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors
+        }
+        if self.file_error:
+            report["file"] = [self.file_error]
+        return report
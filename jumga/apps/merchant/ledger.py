@@ -0,0 +1,365 @@
+"""
+Posting of payments to the ledger.
+
+Payments don't touch the ledger themselves, they queue a LedgerOutbox
+row in their own transaction. Workers drain the outbox in batches,
+locking rows with SKIP LOCKED so any number of them can run side by
+side without posting a payment twice.
+"""
+import datetime
+import logging
+from collections import defaultdict
+from decimal import Decimal as D
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from jumga.apps.account.models import Merchant, Rider
+from .cache import platform_accounts
+from .models import (ArchivedPartition, LedgerDailyRollup, LedgerOutbox, Notification,
+                     Order, Payment, Transaction, approximate, transaction_reference)
+from .notifications import notify_orders
+from .partitions import TABLE as ARCHIVED_TABLE, add_months
+from .riders import assign_rider
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+BATCH_SIZE = 100
+
+# Failing postings are retried, RETRY_DELAY seconds after the first
+# failure and twice as long after each one after that, until they reach
+# this many attempts. Then they are left for someone to look at in the
+# admin.
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30
+
+
+class LedgerError(Exception):
+    pass
+
+
+def platform_account_id():
+    """
+    Id of the account credited with Jumga's share. Cached, and dropped
+    from the cache whenever that user is saved or deleted.
+    """
+    email = settings.JUMGA_PLATFORM_EMAIL
+    account = platform_accounts.get_or_set(email, lambda: User.objects.filter(
+        email=email).values_list('id', flat=True).first())
+    if account is None:
+        raise LedgerError('No platform account with email %s.' % email)
+    return account
+
+
+def leg(payment, beneficiary_id, amount, narration):
+    return Transaction(
+        beneficiary_id=beneficiary_id,
+        amount=approximate(amount),
+        currency=payment.currency,
+        tx_ref_from_payment=payment,
+        narration=narration,
+        transaction_type=Transaction.CREDIT,
+        # bulk_create doesn't call Transaction.save
+        transaction_id=transaction_reference(),
+    )
+
+
+def approval_legs(payment, platform_id):
+    return [
+        # Credit Jumga's account
+        leg(payment, platform_id, payment.amount, "Earnings on Shop Approval"),
+    ]
+
+
+def sale_legs(payment, platform_id):
+    shop = payment.order.shop
+    delivery_fee = D(shop.delivery_fee)
+    amount = payment.amount - delivery_fee
+    if shop.rider is None:
+        raise LedgerError('Shop %s has no rider to credit.' % shop.id)
+
+    return [
+        # Credit Jumga's and the Merchant's account on sale
+        leg(payment, platform_id, amount * Order.JUMGA_PERCENTAGE,
+            "Earnings on Sales"),
+        leg(payment, shop.user.user_id, amount * Order.MERCHANT_PERCENTAGE,
+            "Earnings on Sales"),
+        # Credit Jumga's and the Rider's account on Delivery
+        leg(payment, platform_id, delivery_fee * Order.JUMGA_DELIVERY_PERCENTAGE,
+            "Earnings on Delivery"),
+        leg(payment, shop.rider.user_id, delivery_fee * Order.DRIVER_PERCENTAGE,
+            "Earnings on Delivery"),
+    ]
+
+
+def settle_approval(payment):
+    # Activate shop and Assign Rider
+    assign_rider(payment.shop_id, activate=True)
+
+
+def settle_sale(payment):
+    # Change Order status to paid
+    paid = Order.objects.filter(
+        id=payment.order_id,
+        status__in=Order.sources_for(Order.PAYMENT_MADE),
+    ).update(status=Order.PAYMENT_MADE, paid=True, updated_at=timezone.now())
+    if paid:
+        notify_orders([payment.order_id], Notification.ORDER_PAID)
+
+
+# payment type -> (ledger legs, what else the payment settles)
+POSTINGS = {
+    Payment.APPROVAL: (approval_legs, settle_approval),
+    Payment.SALE: (sale_legs, settle_sale),
+}
+
+
+def post_payment(payment):
+    """
+    Writes every ledger leg of one payment with a single insert and
+    returns them. A payment that already has entries is left alone, so
+    posting it again is harmless.
+    """
+    if payment.payment_type not in POSTINGS:
+        return []
+    if Transaction.objects.filter(tx_ref_from_payment=payment).exists():
+        return []
+
+    legs, settle = POSTINGS[payment.payment_type]
+    posted = Transaction.objects.bulk_create(legs(payment, platform_account_id()))
+    settle(payment)
+    return posted
+
+
+def signed_amount(entry):
+    return entry.amount if entry.transaction_type == Transaction.CREDIT else -entry.amount
+
+
+def balance_currencies(user_ids):
+    """
+    {user id: currency} for the users whose account_balance is kept, in
+    the currency of their merchant or rider country. Anyone else, the
+    platform account among them, is paid in several currencies and only
+    has the per-currency balances().
+    """
+    currencies = dict(
+        Rider.objects.filter(user_id__in=user_ids, country__isnull=False)
+        .values_list('user_id', 'country__currency'))
+    currencies.update(
+        Merchant.objects.filter(user_id__in=user_ids, country__isnull=False)
+        .values_list('user_id', 'country__currency'))
+    return currencies
+
+
+def post_balances(entries):
+    """
+    Adds the entries in each beneficiary's own currency to their
+    account_balance, one UPDATE per user. Users are updated in a fixed
+    order so concurrent workers can't deadlock on them.
+    """
+    currencies = balance_currencies({entry.beneficiary_id for entry in entries})
+    deltas = defaultdict(D)
+    for entry in entries:
+        if entry.currency == currencies.get(entry.beneficiary_id):
+            deltas[entry.beneficiary_id] += signed_amount(entry)
+
+    for user_id in sorted(deltas, key=str):
+        if deltas[user_id]:
+            User.objects.filter(id=user_id).update(
+                account_balance=F('account_balance') + deltas[user_id])
+
+
+def drain_outbox(batch_size=BATCH_SIZE):
+    """
+    Posts one batch of pending outbox rows. Each posting runs in a
+    savepoint, so a failing payment only records its error and the rest
+    of the batch still commits. Returns (posted, failed).
+    """
+    posted = failed = 0
+    entries_posted = []
+    with transaction.atomic():
+        entries = list(
+            LedgerOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()))
+            .select_related('payment__order__shop__user', 'payment__order__shop__rider')
+            .order_by('id')[:batch_size])
+
+        for entry in entries:
+            entry.attempts += 1
+            try:
+                with transaction.atomic():
+                    entries_posted += post_payment(entry.payment)
+            except Exception as exc:
+                logger.exception('Ledger posting of payment %s failed', entry.payment_id)
+                entry.last_error = repr(exc)
+                entry.next_attempt_at = timezone.now() + datetime.timedelta(
+                    seconds=RETRY_DELAY * 2 ** (entry.attempts - 1))
+                failed += 1
+            else:
+                entry.processed_at = timezone.now()
+                entry.last_error = ''
+                posted += 1
+
+        # Balances are applied once for the whole batch, at the end, so
+        # the hot platform account row is only locked briefly.
+        post_balances(entries_posted)
+        LedgerOutbox.objects.bulk_update(
+            entries, ['attempts', 'last_error', 'next_attempt_at', 'processed_at'])
+    return posted, failed
+
+
+def drain(batch_size=BATCH_SIZE):
+    """
+    Drains batches until nothing is due. Failed rows are put off until
+    their next attempt, so they don't come back within the same drain.
+    """
+    total_posted = total_failed = 0
+    while True:
+        posted, failed = drain_outbox(batch_size)
+        if not posted and not failed:
+            return total_posted, total_failed
+        total_posted += posted
+        total_failed += failed
+
+
+# DAILY ROLLUPS
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def daily_totals(entries):
+    """
+    Entries summed per (user, day, currency).
+    """
+    zero = Value(0, output_field=DecimalField())
+    return entries.order_by()\
+        .annotate(day=TruncDate('created_at'))\
+        .values('beneficiary_id', 'day', 'currency')\
+        .annotate(
+            credit=Coalesce(Sum('amount', filter=Q(
+                transaction_type=Transaction.CREDIT)), zero),
+            debit=Coalesce(Sum('amount', filter=Q(
+                transaction_type=Transaction.DEBIT)), zero),
+            entries=Count('id'))
+
+
+def rebuild_rollups(start=None, end=None):
+    """
+    Recomputes the rollups of the days from `start` up to, but not
+    including, `end` (today by default, the only day still open). Without
+    a start it picks up from the last day rolled up, or from the first
+    entry of the ledger. Days before `start` are kept, so rollups of
+    archived months survive; a start inside an archived month is refused
+    as those entries are gone. Returns (days, rows).
+    """
+    end = end or timezone.localdate()
+    if start is None:
+        start = LedgerDailyRollup.objects.aggregate(day=Max('day'))['day']
+    if start is None:
+        first = Transaction.objects.order_by('created_at')\
+            .values_list('created_at', flat=True).first()
+        start = timezone.localdate(first) if first else end
+    archived = ArchivedPartition.objects.filter(table_name=ARCHIVED_TABLE)\
+        .aggregate(period=Max('period'))['period']
+    if archived is not None and start < add_months(archived, 1):
+        raise LedgerError(
+            'Entries before %s are archived, their rollups can no longer be rebuilt.'
+            % add_months(archived, 1))
+    if start >= end:
+        return 0, 0
+
+    entries = Transaction.objects.filter(
+        created_at__gte=day_start(start), created_at__lt=day_start(end))
+    with transaction.atomic():
+        LedgerDailyRollup.objects.filter(day__gte=start, day__lt=end).delete()
+        rows = LedgerDailyRollup.objects.bulk_create([
+            LedgerDailyRollup(
+                user_id=total['beneficiary_id'], day=total['day'],
+                currency=total['currency'], credit=total['credit'],
+                debit=total['debit'], entries=total['entries'])
+            for total in daily_totals(entries).iterator()
+        ], batch_size=1000)
+    return (end - start).days, len(rows)
+
+
+def statement(user_id, start=None, end=None):
+    """
+    One user's daily totals per currency from `start` to `end`
+    (inclusive), oldest first. Closed days come from the rollups and
+    only the entries after the user's last rolled up day are summed, so
+    this costs O(days), not O(entries).
+    """
+    rollups = LedgerDailyRollup.objects.filter(user_id=user_id)
+    through = rollups.aggregate(day=Max('day'))['day']
+    if start is not None:
+        rollups = rollups.filter(day__gte=start)
+    if end is not None:
+        rollups = rollups.filter(day__lte=end)
+
+    days = [{
+        'day': rollup.day, 'currency': rollup.currency,
+        'credit': rollup.credit, 'debit': rollup.debit,
+        'entries': rollup.entries,
+    } for rollup in rollups.order_by('day', 'currency')]
+
+    recent = Transaction.objects.filter(beneficiary_id=user_id)
+    since = max(filter(None, [
+        through and through + datetime.timedelta(days=1), start]), default=None)
+    if since is not None:
+        recent = recent.filter(created_at__gte=day_start(since))
+    if end is not None:
+        recent = recent.filter(created_at__lt=day_start(end + datetime.timedelta(days=1)))
+
+    days += [{
+        'day': total['day'], 'currency': total['currency'],
+        'credit': total['credit'], 'debit': total['debit'],
+        'entries': total['entries'],
+    } for total in daily_totals(recent).order_by('day', 'currency')]
+    return days
+
+
+def balances(user_id):
+    """
+    {currency: {'credit', 'debit', 'balance'}} over the user's whole
+    ledger, read from the rollups plus the entries since.
+    """
+    totals = {}
+    for day in statement(user_id):
+        total = totals.setdefault(day['currency'], {
+            'credit': D('0.00'), 'debit': D('0.00')})
+        total['credit'] += day['credit']
+        total['debit'] += day['debit']
+    for total in totals.values():
+        total['credit'] = approximate(total['credit'])
+        total['debit'] = approximate(total['debit'])
+        total['balance'] = total['credit'] - total['debit']
+    return totals
+
+
+def recount_balances():
+    """
+    Sets every account_balance from the ledger, for balances that
+    predate incremental updates or have drifted. Like post_balances it
+    only counts the user's own currency, users without one are set to
+    zero. Returns the number of users updated.
+    """
+    updated = 0
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        currency = balance_currencies([user_id]).get(user_id)
+        # The row lock holds off drain_outbox's F() updates, so a batch
+        # is either in the ledger we sum or applied on top afterwards.
+        with transaction.atomic():
+            User.objects.select_for_update().filter(id=user_id).exists()
+            balance = sum((day['credit'] - day['debit'] for day in statement(user_id)
+                           if day['currency'] == currency), D('0.00'))
+            updated += User.objects.filter(id=user_id).exclude(
+                account_balance=balance).update(account_balance=balance)
+    return updated
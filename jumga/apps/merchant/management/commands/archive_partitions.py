@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from jumga.apps.merchant.partitions import (
+    PartitioningError, add_months, archive_partitions, month_start)
+
+
+class Command(BaseCommand):
+    help = ('Moves monthly transaction partitions older than --older-than '
+            'months into gzipped NDJSON files on the archive storage, then '
+            'drops them (PostgreSQL only).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=12)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        before = add_months(month_start(timezone.now().date()),
+                            -options['older_than'])
+        try:
+            archived = archive_partitions(
+                connection, before, dry_run=options['dry_run'])
+        except PartitioningError as exc:
+            raise CommandError(exc)
+
+        for name, stored, count in archived:
+            if options['dry_run']:
+                self.stdout.write('Would archive %s' % name)
+            else:
+                self.stdout.write('Archived %s (%s rows) to %s' % (name, count, stored))
+        self.stdout.write(self.style.SUCCESS(
+            'Archived %s partitions' % len(archived)))
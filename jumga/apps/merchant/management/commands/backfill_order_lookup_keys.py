@@ -0,0 +1,32 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from jumga.apps.merchant.models import Order
+from jumga.apps.merchant.orders import BACKFILL_BATCH_SIZE, customer_lookup_key
+
+
+class Command(BaseCommand):
+    help = 'Fills in the customer lookup key of orders placed before it existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every order, not only those without a key')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.only('id', 'customer_email', 'customer_contact')
+        if not options['all']:
+            orders = orders.filter(lookup_key='')
+
+        rows = orders.order_by('id').iterator(chunk_size=options['batch_size'])
+        updated = 0
+        for batch in iter(lambda: list(islice(rows, options['batch_size'])), []):
+            for order in batch:
+                order.lookup_key = customer_lookup_key(
+                    order.customer_email, order.customer_contact)
+            Order.objects.bulk_update(batch, ['lookup_key'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Updated lookup keys of %s orders' % updated))
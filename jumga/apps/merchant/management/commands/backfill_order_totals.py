@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from jumga.apps.merchant.orders import BACKFILL_BATCH_SIZE, backfill_order_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored subtotal, delivery fee and total of every order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        updated = backfill_order_totals(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Updated totals of %s orders' % updated))
@@ -0,0 +1,81 @@
+import time
+import uuid
+from decimal import Decimal as D
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from jumga.apps.merchant.ledger import post_payment, settle_sale
+from jumga.apps.merchant.models import Order, Payment, Transaction
+
+User = get_user_model()
+
+
+def legacy_post(payment):
+    """
+    The sale posting as the Payment post_save receiver used to do it:
+    a platform user lookup and one insert per leg.
+    """
+    jumga_id = User.objects.get(email=settings.JUMGA_PLATFORM_EMAIL)
+    shop = payment.order.shop
+    amount = (payment.amount - D(shop.delivery_fee))
+    legs = (
+        (jumga_id.id, amount * D(float(Order.JUMGA_PERCENTAGE)), "Earnings on Sales"),
+        (shop.user.user_id, amount * D(float(Order.MERCHANT_PERCENTAGE)), "Earnings on Sales"),
+        (jumga_id.id, shop.delivery_fee * D(float(Order.JUMGA_DELIVERY_PERCENTAGE)),
+         "Earnings on Delivery"),
+        (shop.rider.user_id, shop.delivery_fee * D(float(Order.DRIVER_PERCENTAGE)),
+         "Earnings on Delivery"),
+    )
+    for beneficiary_id, value, narration in legs:
+        Transaction.objects.create(
+            beneficiary_id=beneficiary_id,
+            amount=value,
+            currency=payment.currency,
+            tx_ref_from_payment=payment,
+            narration=narration,
+            transaction_type=Transaction.CREDIT
+        )
+    settle_sale(payment)
+
+
+class Command(BaseCommand):
+    help = ('Measures sale postings per second with the old per-leg inserts and '
+            'the bulk posting. Everything it writes is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=500)
+
+    def handle(self, *args, **options):
+        order = Order.objects.filter(shop__rider__isnull=False)\
+            .select_related('shop__user', 'shop__rider').first()
+        if order is None:
+            raise CommandError('Needs an order from a shop with a rider.')
+
+        legacy = self.measure(order, options['payments'], legacy_post)
+        bulk = self.measure(order, options['payments'], post_payment)
+
+        self.stdout.write('legacy: %.0f postings/s' % legacy)
+        self.stdout.write('bulk:   %.0f postings/s' % bulk)
+        self.stdout.write(self.style.SUCCESS('%.1fx' % (bulk / legacy)))
+
+    def measure(self, order, count, post):
+        with transaction.atomic():
+            payments = [Payment.objects.create(
+                amount=order.shop.delivery_fee + 100, currency=Payment.NGN,
+                status='successful', flw_ref='benchmark',
+                transaction_id=uuid.uuid4().hex, tx_ref=uuid.uuid4().hex,
+                payment_type=Payment.SALE, order=order, shop=order.shop)
+                for _ in range(count)]
+            for payment in payments:
+                payment.order = order
+
+            start = time.perf_counter()
+            for payment in payments:
+                post(payment)
+            elapsed = time.perf_counter() - start
+
+            transaction.set_rollback(True)
+        return count / elapsed
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from jumga.apps.merchant.partitions import (
+    PartitioningError, add_months, convert, create_partitions, month_start)
+
+
+class Command(BaseCommand):
+    help = ('Creates the monthly partitions of the transaction table ahead of '
+            'time, and those of months that ended up in the default partition '
+            '(PostgreSQL only). Run it from a daily cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='First turn the plain table into a partitioned one')
+
+    def handle(self, *args, **options):
+        start = month_start(timezone.now().date())
+        try:
+            # The legacy partition takes the rest of the current month
+            if options['convert'] and convert(connection, add_months(start, 1)):
+                self.stdout.write('Converted the transaction table')
+            created = create_partitions(
+                connection, start, options['months_ahead'] + 1)
+        except PartitioningError as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created %s partitions %s' % (len(created), ' '.join(created))))
@@ -0,0 +1,113 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Count
+
+REFERENCES = ('transaction_id', 'tx_ref')
+
+# Payments only count as the same if all of these match
+COMPARED_FIELDS = ('amount', 'currency', 'merchant_id', 'shop_id', 'status',
+                   'flw_ref', 'transaction_id', 'tx_ref', 'payment_type',
+                   'order_id', 'narration')
+
+COMPARED_LEG_FIELDS = ('beneficiary_id', 'transaction_type', 'amount',
+                       'currency', 'narration')
+
+
+def applied_models(connection):
+    """
+    Payment and Transaction as the applied migrations left them. This
+    runs while migrate is held at 0019, when the current models describe
+    tables and relations that don't exist yet.
+    """
+    loader = MigrationLoader(connection)
+    state = loader.project_state(list(loader.applied_migrations), at_end=True)
+    return (state.apps.get_model('merchant', 'Payment'),
+            state.apps.get_model('merchant', 'Transaction'))
+
+
+class Command(BaseCommand):
+    help = ('Lists payments that share a transaction_id or tx_ref. With --delete, '
+            'writes the repeats and their ledger entries to --archive, then deletes '
+            'the repeats that are exact copies of the first payment of their group. '
+            'Run it when migrate stops at merchant 0019.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete the exact repeats, nothing is deleted without it.')
+        parser.add_argument('--archive',
+                            help='NDJSON file the deleted rows are written to first.')
+
+    def handle(self, *args, **options):
+        if options['delete'] and not options['archive']:
+            raise CommandError('--delete needs --archive.')
+        if options['archive'] and os.path.exists(options['archive']):
+            raise CommandError('%s already exists.' % options['archive'])
+
+        self.Payment, self.Transaction = applied_models(connection)
+        groups = self.duplicate_groups()
+        exact = [group for group in groups if self.is_exact(group)]
+        differing = [group for group in groups if group not in exact]
+
+        for group in exact:
+            self.stdout.write('Exact: payments %s, keeping %s' % (
+                ', '.join(str(id) for id in group), group[0]))
+        for group in differing:
+            self.stdout.write(self.style.WARNING(
+                'Different: payments %s, resolve by hand' % ', '.join(
+                    str(id) for id in group)))
+
+        if options['delete'] and exact:
+            repeats = [id for group in exact for id in group[1:]]
+            self.archive(repeats, options['archive'])
+            with transaction.atomic():
+                self.Transaction.objects.filter(tx_ref_from_payment__in=repeats).delete()
+                self.Payment.objects.filter(id__in=repeats).delete()
+            self.stdout.write(self.style.SUCCESS(
+                'Deleted %s payments, archived to %s' % (len(repeats), options['archive'])))
+
+        if differing:
+            raise CommandError(
+                '%s groups of payments differ and were left alone.' % len(differing))
+
+    def duplicate_groups(self):
+        """
+        Sorted id lists of the payments sharing a reference, each list once.
+        """
+        groups = set()
+        for field in REFERENCES:
+            values = self.Payment.objects.order_by(field).values(field)\
+                .annotate(count=Count('id')).filter(count__gt=1)\
+                .values_list(field, flat=True)
+            for value in values.iterator():
+                groups.add(tuple(self.Payment.objects.filter(**{field: value})
+                                 .order_by('id').values_list('id', flat=True)))
+        return sorted(groups)
+
+    def is_exact(self, group):
+        payments = self.Payment.objects.filter(id__in=group)\
+            .values_list(*COMPARED_FIELDS)
+        if len(set(payments)) != 1:
+            return False
+
+        legs = {}
+        for leg in self.Transaction.objects.filter(tx_ref_from_payment__in=group)\
+                .values_list('tx_ref_from_payment_id', *COMPARED_LEG_FIELDS):
+            legs.setdefault(leg[0], []).append(leg[1:])
+        return len({tuple(sorted(legs.get(id, []))) for id in group}) == 1
+
+    def archive(self, repeats, path):
+        with open(path, 'x') as archive:
+            for payment in self.Payment.objects.filter(id__in=repeats).values():
+                archive.write(json.dumps(
+                    {'table': 'payment', 'row': payment}, cls=DjangoJSONEncoder) + '\n')
+            for entry in self.Transaction.objects.filter(
+                    tx_ref_from_payment__in=repeats).values():
+                archive.write(json.dumps(
+                    {'table': 'transaction', 'row': entry}, cls=DjangoJSONEncoder) + '\n')
+            archive.flush()
+            os.fsync(archive.fileno())
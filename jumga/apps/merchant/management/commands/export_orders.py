@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from jumga.apps.merchant.exports import (
+    CHUNK_SIZE, CSV, NDJSON, ORDER_COLUMNS, stream_export)
+from jumga.apps.merchant.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Streams orders to a CSV or NDJSON file, or to stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-')
+        parser.add_argument('--type', choices=[CSV, NDJSON], default=CSV)
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--merchant', help='Only orders of this merchant user id')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['merchant']:
+            orders = orders.filter(shop__user__user__id=options['merchant'])
+
+        chunks = stream_export(orders, ORDER_COLUMNS, options['type'],
+                               options['gzip'], options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            return
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from jumga.apps.merchant.exports import (
+    CHUNK_SIZE, CSV, NDJSON, TRANSACTION_COLUMNS, stream_export)
+from jumga.apps.merchant.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Streams ledger transactions to a CSV or NDJSON file, or to stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-')
+        parser.add_argument('--type', choices=[CSV, NDJSON], default=CSV)
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--beneficiary', help='Only transactions of this user id')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        transactions = Transaction.objects.all()
+        if options['beneficiary']:
+            transactions = transactions.filter(
+                beneficiary_id=options['beneficiary'])
+
+        chunks = stream_export(transactions, TRANSACTION_COLUMNS, options['type'],
+                               options['gzip'], options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            return
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,86 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from jumga.apps.merchant.models import Order
+from jumga.apps.merchant.webhooks import SIGNATURE_HEADER, SUCCESSFUL
+
+
+def charge_event(order, status=SUCCESSFUL):
+    """
+    A charge.completed body shaped like Flutterwave's, paying `order`.
+    """
+    return {
+        'event': 'charge.completed',
+        'data': {
+            'id': random.randint(10 ** 8, 10 ** 10),
+            'tx_ref': order.reference_id,
+            'flw_ref': 'FLW-MOCK-%s' % uuid.uuid4().hex,
+            'amount': float(order.total),
+            'currency': order.shop.user.country.currency
+            if order.shop.user.country_id else 'NGN',
+            'status': status,
+            'narration': 'Fake webhook',
+            'meta': {'payment_type': 'sale', 'order': order.id},
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = ('Plays a local fake Flutterwave: posts signed charge webhooks for '
+            'standing orders to a running server, redelivering each a few '
+            'times, and reports the rate and the response codes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000/api/v1/webhooks/flutterwave/')
+        parser.add_argument('--events', type=int, default=100,
+                            help='Number of distinct orders to pay.')
+        parser.add_argument('--redeliveries', type=int, default=2,
+                            help='Extra deliveries of every event.')
+        parser.add_argument('--failed', type=float, default=0.1,
+                            help='Share of events reporting a failed charge.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--secret', default=settings.FLUTTERWAVE_SECRET_HASH)
+
+    def handle(self, *args, **options):
+        if not options['secret']:
+            raise CommandError('Set FLUTTERWAVE_SECRET_HASH or pass --secret.')
+
+        orders = list(Order.objects.filter(status=Order.STANDING)
+                      .select_related('shop__user__country')[:options['events']])
+        if not orders:
+            raise CommandError('There are no standing orders to pay.')
+
+        events = [charge_event(order, 'failed' if random.random() < options['failed']
+                               else SUCCESSFUL) for order in orders]
+        deliveries = events * (options['redeliveries'] + 1)
+        random.shuffle(deliveries)
+
+        def deliver(event):
+            request = urllib.request.Request(
+                options['url'], data=json.dumps(event).encode(), method='POST',
+                headers={'Content-Type': 'application/json',
+                         SIGNATURE_HEADER: options['secret']})
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    return response.status
+            except urllib.error.HTTPError as exc:
+                return exc.code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            codes = Counter(pool.map(deliver, deliveries))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write('%s deliveries of %s events in %.2fs, %.0f/s' % (
+            len(deliveries), len(events), elapsed, len(deliveries) / elapsed))
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join('%s: %s' % item for item in sorted(codes.items()))))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from jumga.apps.merchant.importer import (
+    CHUNK_SIZE, CSV, NDJSON, ProductImporter, detect_type, read_rows)
+from jumga.apps.merchant.models import Shop
+
+
+class Command(BaseCommand):
+    help = 'Imports products for a shop from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shop_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=[CSV, NDJSON])
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            shop = Shop.objects.get(id=options['shop_id'])
+        except Shop.DoesNotExist:
+            raise CommandError('Shop %s does not exist' % options['shop_id'])
+
+        type = options['type'] or detect_type(options['path'])
+        importer = ProductImporter(shop, chunk_size=options['chunk_size'])
+
+        with open(options['path'], 'rb') as stream:
+            report = importer.run(read_rows(stream, type))
+
+        for error in report['errors']:
+            self.stderr.write('row %(row)s: %(errors)s' % error)
+        self.stdout.write(self.style.SUCCESS(
+            'Created %(created)s products, %(failed)s rows failed' % report))
+        if 'file' in report:
+            raise CommandError(report['file'][0])
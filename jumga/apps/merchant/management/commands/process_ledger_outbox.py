@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from jumga.apps.merchant.ledger import BATCH_SIZE, drain
+
+
+class Command(BaseCommand):
+    help = 'Posts the ledger entries of payments waiting in the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling the outbox instead of exiting once it is empty.')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait between polls of an empty outbox.')
+
+    def handle(self, *args, **options):
+        while True:
+            posted, failed = drain(options['batch_size'])
+            if posted or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    'Posted %s payments, %s failed' % (posted, failed)))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from jumga.apps.merchant.webhooks import BATCH_SIZE, drain
+
+
+class Command(BaseCommand):
+    help = 'Creates the payments of the webhook events waiting in the inbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling the inbox instead of exiting once it is empty.')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait between polls of an empty inbox.')
+
+    def handle(self, *args, **options):
+        while True:
+            created, skipped = drain(options['batch_size'])
+            if created or skipped or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    'Created %s payments, skipped %s events' % (created, skipped)))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
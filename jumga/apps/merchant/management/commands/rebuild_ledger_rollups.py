@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jumga.apps.merchant.ledger import LedgerError, rebuild_rollups, recount_balances
+
+
+def date(value):
+    return datetime.date.fromisoformat(value)
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the daily ledger rollups of closed days. Run it once a day; '
+            'without --since it carries on from the last day rolled up.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date, help='First day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--until', type=date,
+                            help='Day to stop before, YYYY-MM-DD (default: today)')
+        parser.add_argument('--balances', action='store_true',
+                            help='Also recompute every account_balance from the ledger.')
+
+    def handle(self, *args, **options):
+        try:
+            days, rows = rebuild_rollups(options['since'], options['until'])
+        except LedgerError as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(
+            'Rolled up %s days into %s rows' % (days, rows)))
+
+        if options['balances']:
+            updated = recount_balances()
+            self.stdout.write(self.style.SUCCESS(
+                'Corrected the balance of %s users' % updated))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from jumga.apps.merchant.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product text search index in bulk.'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt product search index (%s)' % type(backend).__name__))
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# The statements are copied here rather than taken from search.py, so
+# the migration keeps doing what it did when it was written.
+INSTALL = {
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX IF NOT EXISTS product_search_idx ON product USING gin '
+        "((to_tsvector('simple', coalesce(\"product\".\"name\", '') "
+        "|| ' ' || coalesce(\"product\".\"description\", ''))))",
+        'CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON product '
+        'USING gin (name gin_trgm_ops)',
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS product_fts '
+        'USING fts5(name, description)',
+        'DELETE FROM product_fts',
+        'INSERT INTO product_fts (rowid, name, description) '
+        'SELECT id, name, description FROM product',
+    ],
+}
+
+UNINSTALL = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS product_search_idx',
+        'DROP INDEX IF EXISTS product_name_trgm_idx',
+    ],
+    'sqlite': [
+        'DROP TABLE IF EXISTS product_fts',
+    ],
+}
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0013_auto_20210111_2215'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(INSTALL), run_statements(UNINSTALL)),
+    ]
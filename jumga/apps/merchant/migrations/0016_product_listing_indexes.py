@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0015_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'is_active', '-id'], name='product_shop_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'shopcategory', '-id'], name='product_shop_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'price', 'id'], name='product_shop_price_idx'),
+        ),
+    ]
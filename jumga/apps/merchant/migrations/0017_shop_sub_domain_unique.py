@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0016_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shop',
+            name='sub_domain',
+            field=models.SlugField(default='', editable=False, max_length=200, unique=True),
+        ),
+    ]
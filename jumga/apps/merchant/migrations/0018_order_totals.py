@@ -0,0 +1,64 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:44
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def fill_order_totals(apps, schema_editor):
+    """
+    Fills in subtotal/delivery_fee/total of the existing orders, one
+    UPDATE per batch of ids.
+    """
+    Order = apps.get_model('merchant', 'Order')
+    OrderedItem = apps.get_model('merchant', 'OrderedItem')
+
+    subtotal = OrderedItem.objects.filter(order=OuterRef('pk'))\
+        .values('order').annotate(
+            value=Sum(F('quantity') * F('item_price'),
+                      output_field=DecimalField(max_digits=18, decimal_places=2)))\
+        .values('value')
+    delivery_fee = Order.objects.filter(pk=OuterRef('pk'))\
+        .values('shop__delivery_fee')
+
+    ids = Order.objects.order_by('id').values_list('id', flat=True)
+    last = 0
+    while True:
+        batch = list(ids.filter(id__gt=last)[:BATCH_SIZE])
+        if not batch:
+            return
+
+        orders = Order.objects.filter(id__gte=batch[0], id__lte=batch[-1])
+        orders.update(
+            subtotal=Coalesce(Subquery(subtotal), Value(0, output_field=DecimalField())),
+            delivery_fee=Subquery(delivery_fee))
+        orders.update(total=F('subtotal') + F('delivery_fee'))
+        last = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0017_shop_sub_domain_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_fee',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=18),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Duplicates listed in the error, the command reports all of them
+LISTED = 20
+
+
+def check_duplicate_payments(apps, schema_editor):
+    """
+    Client retries created the same payment more than once, each with
+    its own ledger entries. Those have to be reviewed and removed with
+    `manage.py dedupe_payments` before the references can be unique.
+    """
+    Payment = apps.get_model('merchant', 'Payment')
+
+    duplicates = []
+    for field in ('transaction_id', 'tx_ref'):
+        groups = Payment.objects.order_by(field).values(field)\
+            .annotate(count=Count('id')).filter(count__gt=1)
+        for group in groups.iterator():
+            ids = Payment.objects.filter(**{field: group[field]})\
+                .order_by('id').values_list('id', flat=True)
+            duplicates.append('%s %s: payments %s' % (
+                field, group[field], ', '.join(str(id) for id in ids)))
+
+    if duplicates:
+        more = len(duplicates) - LISTED
+        raise RuntimeError(
+            'Payments share a transaction_id or tx_ref, review and remove them '
+            'with `manage.py dedupe_payments` first:\n%s%s' % (
+                '\n'.join(duplicates[:LISTED]),
+                '\n... and %s more' % more if more > 0 else ''))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0018_order_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_payments, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(max_length=128, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='tx_ref',
+            field=models.CharField(max_length=128, unique=True),
+        ),
+    ]
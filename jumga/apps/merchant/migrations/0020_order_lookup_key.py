@@ -0,0 +1,22 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0019_payment_unique_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='lookup_key',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['lookup_key', '-id'], name='order_lookup_key_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0020_order_lookup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPartition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=64)),
+                ('period', models.DateField()),
+                ('file', models.CharField(max_length=255)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'archived_partition',
+                'unique_together': {('table_name', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0021_archived_partition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.EmailField(max_length=128)),
+                ('event', models.CharField(choices=[('order_created', 'Order created'), ('order_paid', 'Order paid'), ('order_delivered', 'Order delivered')], max_length=32)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='merchant.order')),
+            ],
+            options={
+                'db_table': 'notification',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'sent_at'], name='notification_pending_idx'),
+        ),
+    ]
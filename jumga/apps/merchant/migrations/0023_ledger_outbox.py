@@ -0,0 +1,32 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0022_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_outbox', to='merchant.payment')),
+            ],
+            options={
+                'db_table': 'ledger_outbox',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ledgeroutbox',
+            index=models.Index(fields=['processed_at', 'id'], name='ledger_outbox_pending_idx'),
+        ),
+    ]
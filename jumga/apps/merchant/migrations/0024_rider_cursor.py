@@ -0,0 +1,40 @@
+# Generated by Django 3.1.4 on 2026-10-18 13:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_rider_loads(apps, schema_editor):
+    """
+    Sets every rider's active shop count from the shops.
+    """
+    Rider = apps.get_model('account', 'Rider')
+    Shop = apps.get_model('merchant', 'Shop')
+
+    shops = Shop.objects.filter(rider=OuterRef('pk'), is_active=True)\
+        .order_by().values('rider').annotate(count=Count('id')).values('count')
+    Rider.objects.update(active_shop_count=Coalesce(Subquery(shops), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_rider_load'),
+        ('merchant', '0023_ledger_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiderCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'rider_cursor',
+            },
+        ),
+        migrations.RunPython(fill_rider_loads, migrations.RunPython.noop),
+    ]
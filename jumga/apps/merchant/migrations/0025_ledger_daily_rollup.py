@@ -0,0 +1,43 @@
+# Generated by Django 3.1.4 on 2026-10-18 13:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('merchant', '0024_rider_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('NGN', 'NGN'), ('GHS', 'GHS'), ('KES', 'KES'), ('GBP', 'GBP'), ('USD', 'USD')], max_length=5)),
+                ('day', models.DateField()),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('entries', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'ledger_daily_rollup',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['beneficiary', 'created_at'], name='transaction_beneficiary_idx'),
+        ),
+        migrations.AddField(
+            model_name='ledgerdailyrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ledgerdailyrollup',
+            unique_together={('user', 'day', 'currency')},
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.4 on 2026-10-18 13:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0025_ledger_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='reference_id',
+            field=models.CharField(db_index=True, editable=False, max_length=128),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=64)),
+                ('transaction_id', models.CharField(max_length=128, unique=True)),
+                ('flw_ref', models.CharField(max_length=128, unique=True)),
+                ('payload', models.JSONField()),
+                ('error', models.TextField(blank=True, default='')),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='merchant.payment')),
+            ],
+            options={
+                'db_table': 'webhook_event',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['processed_at', 'id'], name='webhook_event_pending_idx'),
+        ),
+    ]
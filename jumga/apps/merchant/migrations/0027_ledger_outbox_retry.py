@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchant', '0026_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledgeroutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
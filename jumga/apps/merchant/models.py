@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from decimal import Decimal as D
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
 from django.utils import timezone
@@ -9,10 +10,18 @@ from django.core.exceptions import ValidationError
 import uuid
 from django.contrib.auth import get_user_model
 from django.db import models
-from django.db import transaction, IntegrityError
+from django.db import transaction
 
 from jumga.extras import CharNullField
-from jumga.apps.account.models import Merchant, Customer, Rider
+from jumga.apps.account.models import Merchant, Customer, Rider, Country
+from .cache import (invalidate_storefronts, invalidate_shop_hosts, invalidate_shop_prices,
+                    invalidate_product_prices,
+                    invalidate_platform_account, platform_accounts)
+from . import search
+from .tasks import generate_image_derivatives, process_ledger_outbox
+from .orders import customer_lookup_key
+from .notifications import notify_orders
+from .riders import move_shops
 
 User = get_user_model()
 
@@ -21,6 +30,15 @@ def approximate(val):
     return D(val).quantize(D('0.01'))
 
 
+def transaction_reference():
+    return str(uuid.uuid4())[:18].strip('-')
+
+
+def product_slug(name):
+    return (slugify(name[:40], allow_unicode=True).strip(
+        '-')+'-'+str(uuid.uuid4())[:13]).strip('-')
+
+
 class Shop(models.Model):
 
     user = models.ForeignKey(
@@ -31,7 +49,8 @@ class Shop(models.Model):
 
     name = models.CharField(max_length=500)
     description = models.CharField(max_length=256, blank=True)
-    sub_domain = models.SlugField(default='', editable=False, max_length=200)
+    sub_domain = models.SlugField(
+        default='', editable=False, max_length=200, unique=True)
 
     delivery_fee = models.IntegerField()
 
@@ -40,6 +59,12 @@ class Shop(models.Model):
     banner_image = models.ImageField(
         upload_to='banner/', blank=True, null=True)
 
+    # Resized versions of the images above, filled in by a celery task
+    logo_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False)
+    banner_image_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False)
+
     is_active = models.BooleanField(default=False)
 
     updated_at = models.DateTimeField(auto_now=True)
@@ -105,6 +130,8 @@ class Product(models.Model):
 
     image = models.ImageField(
         upload_to='shop/', blank=True, null=True)
+    image_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False)
 
     shop = models.ForeignKey(
         Shop, on_delete=models.CASCADE, related_name="products")
@@ -118,23 +145,31 @@ class Product(models.Model):
 
     class Meta:
         db_table = 'product'
+        # Match the shop product listing filters and orderings
+        indexes = [
+            models.Index(fields=['shop', 'is_active', '-id'],
+                         name='product_shop_active_idx'),
+            models.Index(fields=['shop', 'shopcategory', '-id'],
+                         name='product_shop_category_idx'),
+            models.Index(fields=['shop', 'price', 'id'],
+                         name='product_shop_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
-        self.slug = (slugify(self.name[:40], allow_unicode=True).strip(
-            '-')+'-'+str(uuid.uuid4())[:13]).strip('-')
+        self.slug = product_slug(self.name)
         super().save(*args, **kwargs)
 
 
 class Order(models.Model):
     # PERCENTAGE SHARING RATIO
-    MERCHANT_PERCENTAGE = 0.974
-    JUMGA_PERCENTAGE = 0.026
+    MERCHANT_PERCENTAGE = D('0.974')
+    JUMGA_PERCENTAGE = D('0.026')
 
-    DRIVER_PERCENTAGE = 0.8
-    JUMGA_DELIVERY_PERCENTAGE = 0.2
+    DRIVER_PERCENTAGE = D('0.8')
+    JUMGA_DELIVERY_PERCENTAGE = D('0.2')
 
     # FEE FOR DELIVERY
     # DELIVERY_FEE = approximate(20.00)
@@ -152,6 +187,14 @@ class Order(models.Model):
         (DELIVERED, 'delivered')
     )
 
+    # Statuses an order may move to from each status
+    TRANSITIONS = {
+        STANDING: (CANCELLED, PAYMENT_MADE),
+        PAYMENT_MADE: (DELIVERED, CANCELLED),
+        CANCELLED: (),
+        DELIVERED: (),
+    }
+
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     customer_name = models.CharField(max_length=250, default='')
     customer_email = models.CharField(max_length=250, default='')
@@ -164,7 +207,12 @@ class Order(models.Model):
     customer_instruction = models.CharField(
         max_length=100, default='', blank=True)
 
-    reference_id = models.CharField(max_length=128, editable=False)
+    reference_id = models.CharField(
+        max_length=128, editable=False, db_index=True)
+
+    # customer_lookup_key() of the customer's email and contact
+    lookup_key = models.CharField(
+        max_length=64, default='', editable=False)
 
     order_items = models.ManyToManyField(
         Product, through='OrderedItem', related_name='orders')
@@ -173,11 +221,23 @@ class Order(models.Model):
 
     paid = models.BooleanField(default=False)
 
+    # Worked out once at checkout so listings don't re-add the items
+    subtotal = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0, editable=False)
+    delivery_fee = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0, editable=False)
+    total = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0, editable=False)
+
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'order'
+        indexes = [
+            models.Index(fields=['lookup_key', '-id'],
+                         name='order_lookup_key_idx'),
+        ]
 
     def __str__(self):
         return 'Order {}'.format(self.id)
@@ -188,6 +248,17 @@ class Order(models.Model):
             "currency": self.shop.user.country.currency
         }
 
+    @classmethod
+    def sources_for(cls, status):
+        """
+        Statuses from which an order may move to `status`.
+        """
+        return [source for source, targets in cls.TRANSITIONS.items()
+                if status in targets]
+
+    def can_transition(self, status):
+        return status in self.TRANSITIONS[self.status]
+
     @property
     def get_total_cost(self):
         subtotal = sum([item.get_cost for item in self.items.all()])
@@ -252,8 +323,8 @@ class Payment(models.Model):
     status = models.CharField(max_length=128)
 
     flw_ref = models.CharField(max_length=128)
-    transaction_id = models.CharField(max_length=128)
-    tx_ref = models.CharField(max_length=128)
+    transaction_id = models.CharField(max_length=128, unique=True)
+    tx_ref = models.CharField(max_length=128, unique=True)
 
     payment_type = models.CharField(max_length=64, choices=PAYMENT_TYPE)
 
@@ -312,100 +383,169 @@ class Transaction(models.Model):
 
     class Meta:
         db_table = 'transaction'
+        indexes = [
+            models.Index(fields=['beneficiary', 'created_at'],
+                         name='transaction_beneficiary_idx'),
+        ]
 
     def __str__(self):
         return "Transaction ID: "+self.transaction_id
 
     def save(self, *args, **kwargs):
-        self.transaction_id = str(uuid.uuid4())[:18].strip('-')
+        self.transaction_id = transaction_reference()
         super().save(*args, **kwargs)
 
 
+class Notification(models.Model):
+    """
+    An order event waiting to be emailed to a merchant. Pending rows of
+    a recipient are sent together as one digest.
+    """
+    ORDER_CREATED = 'order_created'
+    ORDER_PAID = 'order_paid'
+    ORDER_DELIVERED = 'order_delivered'
+
+    EVENTS = (
+        (ORDER_CREATED, 'Order created'),
+        (ORDER_PAID, 'Order paid'),
+        (ORDER_DELIVERED, 'Order delivered'),
+    )
+
+    recipient = models.EmailField(max_length=128)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    event = models.CharField(max_length=32, choices=EVENTS)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'notification'
+        indexes = [
+            models.Index(fields=['recipient', 'sent_at'],
+                         name='notification_pending_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.get_event_display(), self.order_id)
+
+
+class ArchivedPartition(models.Model):
+    """
+    A monthly ledger partition that archive_partitions moved out of the
+    database into a gzipped NDJSON file on the archive storage.
+    """
+    table_name = models.CharField(max_length=64)
+    period = models.DateField()
+    file = models.CharField(max_length=255)
+    row_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'archived_partition'
+        unique_together = (("table_name", "period"),)
+
+    def __str__(self):
+        return '%s %s' % (self.table_name, self.period.strftime('%Y-%m'))
+
+
+class LedgerDailyRollup(models.Model):
+    """
+    One user's ledger entries of one day in one currency, summed up.
+    Rebuilt from the ledger by rebuild_ledger_rollups; balances and
+    statements read these and only sum the entries after the last day
+    rolled up.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    currency = models.CharField(max_length=5, choices=Transaction.CURRENCY)
+    day = models.DateField()
+    credit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    debit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    entries = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'ledger_daily_rollup'
+        unique_together = (("user", "day", "currency"),)
+
+    def __str__(self):
+        return '%s %s %s' % (self.user_id, self.day, self.currency)
+
+
+class WebhookEvent(models.Model):
+    """
+    A payment event as the provider delivered it. The webhook only
+    inserts these, redeliveries are dropped by the unique references,
+    and webhooks.drain_inbox turns them into payments in batches.
+    """
+    event = models.CharField(max_length=64)
+    transaction_id = models.CharField(max_length=128, unique=True)
+    flw_ref = models.CharField(max_length=128, unique=True)
+    payload = models.JSONField()
+    payment = models.ForeignKey(
+        Payment, on_delete=models.SET_NULL, blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'webhook_event'
+        indexes = [
+            models.Index(fields=['processed_at', 'id'],
+                         name='webhook_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.event, self.transaction_id)
+
+
+class RiderCursor(models.Model):
+    """
+    Where a round robin rider assignment left off, see riders.RoundRobin.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'rider_cursor'
+
+    def __str__(self):
+        return '%s at %s' % (self.name, self.position)
+
+
+class LedgerOutbox(models.Model):
+    """
+    A payment whose ledger entries haven't been posted yet. Written in
+    the same transaction as the payment and drained by the ledger
+    worker, see ledger.drain_outbox.
+    """
+    payment = models.OneToOneField(
+        Payment, on_delete=models.CASCADE, related_name='ledger_outbox')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # A failed posting isn't retried before this time
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ledger_outbox'
+        indexes = [
+            models.Index(fields=['processed_at', 'id'],
+                         name='ledger_outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return 'Ledger posting of payment %s' % self.payment_id
+
+
 @receiver(post_save, sender=Payment)
-def initiate_transaction(sender, instance, **kwargs):
-    jumga_id = User.objects.get(email='jumga@gmail.com')
-
-    if kwargs['created']:
-        if instance.payment_type == "approval":
-            try:
-                with transaction.atomic():
-                    # 1. Credit Jumga's account
-                    # jumga_id = '2e66899b-0ca9-44da-941e-89c949cde8cc'
-                    Transaction.objects.create(
-                        beneficiary=jumga_id,
-                        amount=instance.amount,
-                        currency=instance.currency,
-                        tx_ref_from_payment=instance,
-                        narration="Earnings on Shop Approval",
-                        transaction_type=Transaction.CREDIT
-                    )
-
-                    # 2. Activate shop and Assign Rider
-                    # !!! Please, don't this below query in production
-                    random_rider = Rider.objects.order_by('?').first()
-                    shop_obj = Shop.objects.get(id=instance.shop.id)
-                    shop_obj.is_active = True
-                    shop_obj.rider = random_rider
-                    shop_obj.save()
-
-                    # 3 Credit Account balance of Jumga shop
-                    # user_obj = User.objects.get(email=jumga_id)
-                    # user_obj.account_balance += instance.amount
-                    # user_obj.save()
-
-            except IntegrityError:
-                pass
-
-        elif instance.payment_type == "sale":
-            try:
-                with transaction.atomic():
-                    amount = (instance.amount - D(instance.shop.delivery_fee))
-                    # 1. Credit Jumga's account on sale
-                    Transaction.objects.create(
-                        beneficiary=jumga_id,
-                        amount=amount * D(Order.JUMGA_PERCENTAGE),
-                        currency=instance.currency,
-                        tx_ref_from_payment=instance,
-                        narration="Earnings on Sales",
-                        transaction_type=Transaction.CREDIT
-                    )
-                    # 2. Credit Merchant's account on sale
-                    Transaction.objects.create(
-                        beneficiary_id=instance.order.shop.user.user.id,
-                        amount=amount * D(Order.MERCHANT_PERCENTAGE),
-                        currency=instance.currency,
-                        tx_ref_from_payment=instance,
-                        narration="Earnings on Sales",
-                        transaction_type=Transaction.CREDIT
-                    )
-                    # 3. Credit Jumga's account on Delivery
-                    Transaction.objects.create(
-                        beneficiary=jumga_id,
-                        amount=instance.shop.delivery_fee *
-                        D(Order.JUMGA_DELIVERY_PERCENTAGE),
-                        currency=instance.currency,
-                        tx_ref_from_payment=instance,
-                        narration="Earnings on Delivery",
-                        transaction_type=Transaction.CREDIT
-                    )
-                    # 4. Credit Rider's account on Delivery
-                    Transaction.objects.create(
-                        beneficiary_id=instance.order.shop.rider.user.id,
-                        amount=instance.shop.delivery_fee *
-                        D(Order.DRIVER_PERCENTAGE),
-                        currency=instance.currency,
-                        tx_ref_from_payment=instance,
-                        narration="Earnings on Delivery",
-                        transaction_type=Transaction.CREDIT
-                    )
-                    # 5. Change Order status to paid
-                    order_obj = Order.objects.get(id=instance.order.id)
-                    order_obj.status = Order.PAYMENT_MADE
-                    order_obj.paid = True
-                    order_obj.save()
-
-            except IntegrityError:
-                pass
+def enqueue_ledger_posting(sender, instance, created, **kwargs):
+    """
+    Queues the ledger entries of a new payment. The outbox row commits
+    or rolls back with the payment, and the worker is only woken up
+    once it has committed.
+    """
+    if created:
+        LedgerOutbox.objects.create(payment=instance)
+        transaction.on_commit(lambda: process_ledger_outbox.delay())
 
 
 @receiver(models.signals.pre_save, sender=Shop)
@@ -420,18 +560,135 @@ def detect_if_shop_name_has_changed(sender, instance, **kwargs):
         if not instance.sub_domain:
             instance.sub_domain = main_slug
     else:
+        # Remembered so caches keyed on the old sub_domain can be dropped
+        instance._previous_sub_domain = obj.sub_domain
         if not obj.name == instance.name:  # Field has changed
             instance.sub_domain = main_slug
 
 
+# STOREFRONT, SHOP HOST, PRICE AND PLATFORM ACCOUNT CACHE INVALIDATION
+
+@receiver([post_save, post_delete], sender=Shop)
+def invalidate_shop_storefront(sender, instance, **kwargs):
+    invalidate_storefronts(
+        instance.sub_domain, getattr(instance, '_previous_sub_domain', None))
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def invalidate_shop_host(sender, instance, **kwargs):
+    invalidate_shop_hosts(
+        instance.sub_domain, getattr(instance, '_previous_sub_domain', None))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_storefront(sender, instance, **kwargs):
+    invalidate_storefronts(*Shop.objects.filter(
+        id=instance.shop_id).values_list('sub_domain', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def invalidate_shop_price_list(sender, instance, **kwargs):
+    invalidate_shop_prices(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_price(sender, instance, **kwargs):
+    invalidate_product_prices(instance.shop_id, instance.id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_platform_user(sender, instance, **kwargs):
+    email = settings.JUMGA_PLATFORM_EMAIL
+    if instance.email == email or instance.pk == platform_accounts.get(email):
+        invalidate_platform_account()
+
+
+@receiver([post_save, post_delete], sender=Merchant)
+def invalidate_merchant_storefronts(sender, instance, **kwargs):
+    invalidate_storefronts(*Shop.objects.filter(
+        user=instance).values_list('sub_domain', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Country)
+def invalidate_country_storefronts(sender, instance, **kwargs):
+    invalidate_storefronts(*Shop.objects.filter(
+        user__country=instance).values_list('sub_domain', flat=True))
+
+
+# RIDER LOAD
+
+@receiver(models.signals.pre_save, sender=Shop)
+def remember_shop_rider(sender, instance, **kwargs):
+    old = sender.objects.filter(pk=instance.pk).values_list(
+        'rider_id', 'is_active').first() if instance.pk else None
+    instance._counted_rider_id = old[0] if old and old[1] else None
+
+
+@receiver(post_save, sender=Shop)
+def update_rider_load(sender, instance, **kwargs):
+    move_shops(getattr(instance, '_counted_rider_id', None),
+               instance.rider_id if instance.is_active else None)
+    instance._counted_rider_id = instance.rider_id if instance.is_active else None
+
+
+@receiver(post_delete, sender=Shop)
+def release_rider_load(sender, instance, **kwargs):
+    if instance.is_active:
+        move_shops(instance.rider_id, None)
+
+
+# IMAGE DERIVATIVES
+
+def schedule_image_derivatives(instance, *fields):
+    for field in fields:
+        name = getattr(instance, field).name
+        derivatives = getattr(instance, field + '_derivatives')
+        if name and derivatives.get('source') != name:
+            transaction.on_commit(
+                lambda field=field: generate_image_derivatives.delay(
+                    type(instance).__name__, instance.pk, field))
+
+
+@receiver(post_save, sender=Shop)
+def shop_image_derivatives(sender, instance, **kwargs):
+    schedule_image_derivatives(instance, 'logo', 'banner_image')
+
+
+@receiver(post_save, sender=Product)
+def product_image_derivatives(sender, instance, **kwargs):
+    schedule_image_derivatives(instance, 'image')
+
+
+# PRODUCT SEARCH INDEX
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.get_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.get_backend().remove_products([instance.id])
+
+
 def set_reference_id(sender, instance, **kwargs):
     if not instance.reference_id:
         instance.reference_id = "ref_"+str(uuid.uuid4())[:14].strip('-')
+    instance.lookup_key = customer_lookup_key(
+        instance.customer_email, instance.customer_contact)
 
 
 models.signals.pre_save.connect(set_reference_id, sender=Order)
 
 
+# ORDER NOTIFICATIONS
+
+@receiver(post_save, sender=Order)
+def notify_order_created(sender, instance, created, **kwargs):
+    if created:
+        notify_orders([instance.id], Notification.ORDER_CREATED)
+
+
 # merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE)
 # customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
 # rider = models.ForeignKey(Rider, on_delete=models.CASCADE)
@@ -0,0 +1,52 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .tasks import digest_key, send_notification_digest
+
+
+def notify_orders(order_ids, event):
+    """
+    Queues an `event` notification to the merchant of each order. The
+    rows are written in the current transaction and the digest is only
+    scheduled once it commits, so nothing is sent for a rolled back
+    order and no email is sent inside the request.
+    """
+    Order = apps.get_model('merchant', 'Order')
+    Notification = apps.get_model('merchant', 'Notification')
+
+    rows = [(id, email) for id, email in Order.objects.filter(
+        id__in=order_ids).values_list('id', 'shop__user__user__email') if email]
+    if not rows:
+        return
+
+    Notification.objects.bulk_create([
+        Notification(order_id=id, recipient=email, event=event)
+        for id, email in rows
+    ])
+    recipients = {email for _, email in rows}
+    transaction.on_commit(lambda: schedule_digests(recipients))
+
+
+def notify_status_change(order_ids, status):
+    """
+    Queues the notification, if any, for orders moved to `status`.
+    """
+    Order = apps.get_model('merchant', 'Order')
+    Notification = apps.get_model('merchant', 'Notification')
+
+    events = {Order.DELIVERED: Notification.ORDER_DELIVERED}
+    if order_ids and status in events:
+        notify_orders(order_ids, events[status])
+
+
+def schedule_digests(recipients):
+    """
+    Schedules one digest per recipient. Events that arrive while a
+    digest is already waiting are picked up by that digest.
+    """
+    delay = settings.NOTIFICATION_DIGEST_DELAY
+    for recipient in recipients:
+        if cache.add(digest_key(recipient), 1, delay + 60):
+            send_notification_digest.apply_async((recipient,), countdown=delay)
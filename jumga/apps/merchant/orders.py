@@ -0,0 +1,165 @@
+import hashlib
+import re
+import uuid
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import product_price_key, product_prices, shop_quotes
+from .notifications import notify_status_change
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def customer_lookup_key(email, contact):
+    """
+    Hash of the normalised email and phone digits a customer looks their
+    orders up with, so the lookup hits one indexed column.
+    """
+    value = '%s:%s' % (email.strip().lower(), re.sub(r'\D', '', contact))
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def merge_cart(cart):
+    """
+    {product id: quantity} of a cart, adding up repeated lines.
+    """
+    quantities = {}
+    for item in cart:
+        quantities[item['id']] = quantities.get(item['id'], 0) + item['quantity']
+    return quantities
+
+
+def load_shop_quote(shop_id):
+    Shop = apps.get_model('merchant', 'Shop')
+
+    delivery_fee = Shop.objects.filter(id=shop_id)\
+        .values_list('delivery_fee', flat=True).first()
+    if delivery_fee is None:
+        return None
+    return {'delivery_fee': Decimal(delivery_fee), 'version': uuid.uuid4().hex}
+
+
+def load_prices(shop_id, product_ids):
+    """
+    {product id: (name, price), or 0 when it isn't on sale in the shop}.
+    """
+    Product = apps.get_model('merchant', 'Product')
+
+    prices = dict.fromkeys(product_ids, 0)
+    for id, name, price in Product.objects.filter(
+            shop_id=shop_id, is_active=True, id__in=product_ids)\
+            .values_list('id', 'name', 'price'):
+        prices[id] = (name, Decimal(price))
+    return prices
+
+
+def quote_cart(shop_id, cart):
+    """
+    Prices a cart from cached per-product prices without writing
+    anything; only products missing from the cache are read, with one
+    query. Products that aren't on sale in the shop are listed under
+    `unavailable`. Returns None for an unknown shop.
+    """
+    shop = shop_quotes.get_or_set(shop_id, lambda: load_shop_quote(shop_id))
+    if shop is None:
+        return None
+
+    quantities = merge_cart(cart)
+    keys = {id: product_price_key(shop_id, shop['version'], id) for id in quantities}
+    cached = product_prices.get_many(keys.values())
+    missing = [id for id, key in keys.items() if key not in cached]
+    if missing:
+        loaded = {keys[id]: value for id, value in load_prices(shop_id, missing).items()}
+        product_prices.set_many(loaded)
+        cached.update(loaded)
+
+    items = []
+    unavailable = []
+    for id, quantity in quantities.items():
+        if not cached[keys[id]]:
+            unavailable.append(id)
+            continue
+        name, price = cached[keys[id]]
+        items.append({
+            'id': id,
+            'name': name,
+            'price': price,
+            'quantity': quantity,
+            'cost': price * quantity,
+        })
+
+    subtotal = sum((item['cost'] for item in items), Decimal('0'))
+    return {
+        'shop': shop_id,
+        'items': items,
+        'unavailable': unavailable,
+        'subtotal': subtotal,
+        'delivery_fee': shop['delivery_fee'],
+        'total': subtotal + shop['delivery_fee'],
+    }
+
+
+def order_totals(items, delivery_fee):
+    """
+    (subtotal, delivery_fee, total) for an order from its line items.
+    """
+    subtotal = sum((item.get_cost for item in items), Decimal('0'))
+    delivery_fee = Decimal(delivery_fee)
+    return subtotal, delivery_fee, subtotal + delivery_fee
+
+
+def backfill_order_totals(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Recomputes subtotal/delivery_fee/total of every order from its items
+    and its shop, one UPDATE per batch of ids.
+    """
+    Order = apps.get_model('merchant', 'Order')
+    OrderedItem = apps.get_model('merchant', 'OrderedItem')
+
+    subtotal = OrderedItem.objects.filter(order=OuterRef('pk'))\
+        .values('order').annotate(
+            value=Sum(F('quantity') * F('item_price'),
+                      output_field=DecimalField(max_digits=18, decimal_places=2)))\
+        .values('value')
+    delivery_fee = Order.objects.filter(pk=OuterRef('pk'))\
+        .values('shop__delivery_fee')
+
+    ids = Order.objects.order_by('id').values_list('id', flat=True)
+    last = 0
+    updated = 0
+    while True:
+        batch = list(ids.filter(id__gt=last)[:batch_size])
+        if not batch:
+            return updated
+
+        orders = Order.objects.filter(id__gte=batch[0], id__lte=batch[-1])
+        orders.update(
+            subtotal=Coalesce(Subquery(subtotal), Value(0, output_field=DecimalField())),
+            delivery_fee=Subquery(delivery_fee))
+        orders.update(total=F('subtotal') + F('delivery_fee'))
+        updated += len(batch)
+        last = batch[-1]
+
+
+def transition_orders(queryset, ids, status):
+    """
+    Moves the orders of `queryset` listed in `ids` to `status`, as far as
+    Order.TRANSITIONS allows. The eligible rows are locked and changed
+    with one conditional UPDATE; returns (updated ids, rejected ids).
+    """
+    sources = queryset.model.sources_for(status)
+    with transaction.atomic():
+        eligible = list(queryset.select_for_update(of=('self',)).filter(
+            id__in=ids, status__in=sources).values_list('id', flat=True))
+        if eligible:
+            queryset.model.objects.filter(id__in=eligible, status__in=sources).update(
+                status=status, updated_at=timezone.now())
+            notify_status_change(eligible, status)
+
+    rejected = sorted(set(ids) - set(eligible))
+    return sorted(eligible), rejected
@@ -0,0 +1,395 @@
+"""
+Monthly range partitioning of the ledger on PostgreSQL.
+
+Only the `transaction` table is partitioned. A partitioned table's
+unique constraints must include the partition key, so its rows can't
+be the target of a foreign key on `id` alone. `order` is referenced by
+`ordereditem` and `payment`, and `payment` by `transaction`, so those
+tables can't be partitioned. `ordereditem` has no timestamp to
+partition on. `transaction` is a leaf with `created_at` and is also the
+table that grows fastest.
+"""
+import datetime
+import json
+import re
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import get_storage_class
+from django.db import transaction
+from django.db.models import Sum
+
+from .exports import gzip_blocks
+from .models import ArchivedPartition, LedgerDailyRollup
+
+TABLE = 'transaction'
+
+# Rows that predate partitioning stay in this partition
+LEGACY_PARTITION = TABLE + '_legacy'
+
+# Takes the rows of months that have no partition yet, so inserts keep
+# working if create_partitions stops running for a while.
+DEFAULT_PARTITION = TABLE + '_default'
+
+FETCH_SIZE = 2000
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def month_start(date):
+    return datetime.date(date.year, date.month, 1)
+
+
+def add_months(date, months):
+    month = date.month - 1 + months
+    return datetime.date(date.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return '%s_p%04d%02d' % (TABLE, month.year, month.month)
+
+
+def archive_name(month):
+    return '%s/%04d-%02d.ndjson.gz' % (TABLE, month.year, month.month)
+
+
+def archive_storage():
+    return get_storage_class(settings.ARCHIVE_FILE_STORAGE)()
+
+
+def check_vendor(connection):
+    if connection.vendor != 'postgresql':
+        raise PartitioningError(
+            'Partitioning needs PostgreSQL, not %s.' % connection.vendor)
+
+
+def is_partitioned(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE])
+        return cursor.fetchone() is not None
+
+
+def convert(connection, first_month):
+    """
+    Turns the plain table into a table partitioned by created_at. The
+    existing rows become the legacy partition, covering everything
+    before `first_month`, so nothing is copied. `first_month` must be
+    after the newest row, the month after the current one. A default
+    partition catches rows of months create_partitions hasn't made.
+    """
+    check_vendor(connection)
+    if is_partitioned(connection):
+        return False
+
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('LOCK TABLE %s IN ACCESS EXCLUSIVE MODE' % quote(TABLE))
+        cursor.execute('ALTER TABLE %s RENAME TO %s' % (
+            quote(TABLE), quote(LEGACY_PARTITION)))
+        # A partition can only have the parent's primary key, which has
+        # to include created_at. It is built on the legacy rows when the
+        # partition is attached.
+        cursor.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (
+            quote(LEGACY_PARTITION), quote(TABLE + '_pkey')))
+        cursor.execute(
+            'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING STORAGE) '
+            'PARTITION BY RANGE (created_at)' % (
+                quote(TABLE), quote(LEGACY_PARTITION)))
+        cursor.execute('ALTER TABLE %s ADD PRIMARY KEY (id, created_at)' % quote(TABLE))
+
+        # Indexes and foreign keys declared on the parent are created on
+        # every partition. The legacy partition's own ones match and are
+        # reused when it is attached.
+        cursor.execute(
+            'CREATE INDEX ON %s (beneficiary_id)' % quote(TABLE))
+        cursor.execute(
+            'CREATE INDEX ON %s (tx_ref_from_payment_id)' % quote(TABLE))
+        cursor.execute(
+            'CREATE INDEX ON %s (beneficiary_id, created_at)' % quote(TABLE))
+        cursor.execute(
+            'ALTER TABLE %s ADD FOREIGN KEY (beneficiary_id) REFERENCES %s (id) '
+            'DEFERRABLE INITIALLY DEFERRED' % (quote(TABLE), quote('user')))
+        cursor.execute(
+            'ALTER TABLE %s ADD FOREIGN KEY (tx_ref_from_payment_id) '
+            'REFERENCES %s (id) DEFERRABLE INITIALLY DEFERRED' % (
+                quote(TABLE), quote('payment')))
+
+        # The id sequence moves to the new parent so it outlives the
+        # legacy partition.
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id')", [LEGACY_PARTITION])
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute('ALTER SEQUENCE %s OWNED BY %s.id' % (
+                sequence, quote(TABLE)))
+
+        cursor.execute(
+            "ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (MINVALUE) TO (%%s)" % (
+                quote(TABLE), quote(LEGACY_PARTITION)),
+            [first_month.isoformat()])
+        cursor.execute('CREATE TABLE %s PARTITION OF %s DEFAULT' % (
+            quote(DEFAULT_PARTITION), quote(TABLE)))
+    return True
+
+
+def legacy_end(connection):
+    """
+    First month after the legacy partition, or None once it is gone.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_class c "
+            "WHERE c.relname = %s AND c.relispartition", [LEGACY_PARTITION])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    # FOR VALUES FROM (MINVALUE) TO ('2021-02-01 00:00:00+00')
+    return datetime.date.fromisoformat(re.search(r"TO \('(\d{4}-\d{2}-\d{2})", row[0]).group(1))
+
+
+def default_exists(cursor):
+    cursor.execute('SELECT to_regclass(%s)', [DEFAULT_PARTITION])
+    return cursor.fetchone()[0] is not None
+
+
+def partition_months(connection, name):
+    """
+    Months that have rows in the partition `name`, oldest first.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if not cursor.fetchone()[0]:
+            return []
+        cursor.execute(
+            "SELECT DISTINCT date_trunc('month', created_at)::date FROM %s" % quote(name))
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def create_partition(connection, month):
+    """
+    Creates the partition of `month`. Rows of the month that went to the
+    default partition are moved into it, the default partition is
+    detached meanwhile as the two can't overlap.
+    """
+    quote = connection.ops.quote_name
+    name = partition_name(month)
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        moving = False
+        if default_exists(cursor):
+            cursor.execute(
+                'SELECT 1 FROM %s WHERE created_at >= %%s AND created_at < %%s LIMIT 1'
+                % quote(DEFAULT_PARTITION), bounds)
+            moving = cursor.fetchone() is not None
+
+        if moving:
+            cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (
+                quote(TABLE), quote(DEFAULT_PARTITION)))
+        cursor.execute(
+            'CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)' % (
+                quote(name), quote(TABLE)), bounds)
+        if moving:
+            cursor.execute(
+                'WITH moved AS (DELETE FROM %s WHERE created_at >= %%s AND created_at < %%s '
+                'RETURNING *) INSERT INTO %s SELECT * FROM moved' % (
+                    quote(DEFAULT_PARTITION), quote(name)), bounds)
+            cursor.execute('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (
+                quote(TABLE), quote(DEFAULT_PARTITION)))
+    return name
+
+
+def create_partitions(connection, start, months):
+    """
+    Creates the monthly partitions from `start` for `months` months,
+    and those of any month that has rows in the default partition,
+    skipping those that exist and the months the legacy partition
+    covers. Returns the names created.
+    """
+    check_vendor(connection)
+    first = month_start(start)
+    legacy = legacy_end(connection)
+    if legacy is not None and legacy > first:
+        first = legacy
+
+    wanted = {add_months(first, offset) for offset in range(months)}
+    wanted.update(partition_months(connection, DEFAULT_PARTITION))
+
+    created = []
+    with connection.cursor() as cursor:
+        for month in sorted(wanted):
+            cursor.execute('SELECT to_regclass(%s)', [partition_name(month)])
+            if cursor.fetchone()[0]:
+                continue
+            created.append(create_partition(connection, month))
+    return created
+
+
+def monthly_partitions(connection):
+    """
+    (month, name) of every monthly partition, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname", [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        suffix = name[len(TABLE) + 2:]
+        if name.startswith(TABLE + '_p') and len(suffix) == 6 and suffix.isdigit():
+            partitions.append(
+                (datetime.date(int(suffix[:4]), int(suffix[4:]), 1), name))
+    return partitions
+
+
+def month_filter(month):
+    return ('WHERE created_at >= %s AND created_at < %s',
+            [month.isoformat(), add_months(month, 1).isoformat()])
+
+
+def partition_lines(connection, name, month):
+    quote = connection.ops.quote_name
+    where, params = month_filter(month)
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(
+            'SELECT row_to_json(t)::text FROM %s t %s ORDER BY id' % (quote(name), where),
+            params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield (row[0] + '\n').encode()
+
+
+def check_rolled_up(month, count):
+    """
+    Balances and statements only have the daily rollups to go on once a
+    month is archived, so every entry of the month must be in them.
+    """
+    rolled_up = LedgerDailyRollup.objects.filter(
+        day__gte=month, day__lt=add_months(month, 1),
+    ).aggregate(entries=Sum('entries'))['entries'] or 0
+    if rolled_up != count:
+        raise PartitioningError(
+            'The rollups of %s cover %s of its %s entries, run '
+            'rebuild_ledger_rollups first.' % (month.strftime('%Y-%m'), rolled_up, count))
+
+
+def archive_month(connection, month, name, storage):
+    """
+    Writes the rows of `month` in the partition `name` as gzipped NDJSON
+    to `storage` and records the file. Refuses months the rollups don't
+    fully cover. Returns (stored file name, row count).
+    """
+    quote = connection.ops.quote_name
+    where, params = month_filter(month)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM %s %s' % (quote(name), where), params)
+        count = cursor.fetchone()[0]
+    check_rolled_up(month, count)
+
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as buffer:
+        lines = partition_lines(connection, name, month)
+        for chunk in gzip_blocks(lines):
+            buffer.write(chunk)
+        buffer.seek(0)
+        stored = storage.save(archive_name(month), File(buffer))
+
+    ArchivedPartition.objects.update_or_create(
+        table_name=TABLE, period=month,
+        defaults={'file': stored, 'row_count': count})
+    return stored, count
+
+
+def drop_partition(connection, name):
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (
+            quote(TABLE), quote(name)))
+        cursor.execute('DROP TABLE %s' % quote(name))
+
+
+def archive_partition(connection, month, name, storage):
+    """
+    Archives a monthly partition, then detaches and drops it. Returns
+    [(name, stored file name, row count)].
+    """
+    with transaction.atomic(using=connection.alias):
+        stored, count = archive_month(connection, month, name, storage)
+        drop_partition(connection, name)
+    return [(name, stored, count)]
+
+
+def archive_legacy_partition(connection, storage):
+    """
+    Archives the rows that predate partitioning one month at a time,
+    like the monthly partitions, then detaches and drops the legacy
+    partition. Returns [(month, stored file name, row count)].
+    """
+    archived = []
+    with transaction.atomic(using=connection.alias):
+        for month in partition_months(connection, LEGACY_PARTITION):
+            archived.append(('%s %s' % (LEGACY_PARTITION, month.strftime('%Y-%m')),) + archive_month(
+                connection, month, LEGACY_PARTITION, storage))
+        drop_partition(connection, LEGACY_PARTITION)
+    return archived
+
+
+def archive_partitions(connection, before, storage=None, dry_run=False):
+    """
+    Archives every partition that ends on or before `before`: the legacy
+    partition once all of it is that old, then the monthly partitions.
+    Returns (name, stored file name, row count) of every archived month.
+    """
+    check_vendor(connection)
+    storage = storage or archive_storage()
+    archived = []
+
+    legacy = legacy_end(connection)
+    if legacy is not None and legacy <= before:
+        if dry_run:
+            archived.append((LEGACY_PARTITION, None, None))
+        else:
+            archived.extend(archive_legacy_partition(connection, storage))
+
+    for month, name in monthly_partitions(connection):
+        if add_months(month, 1) > before:
+            break
+        if dry_run:
+            archived.append((name, None, None))
+        else:
+            archived.extend(archive_partition(connection, month, name, storage))
+    return archived
+
+
+def read_archive(archive, storage=None, chunk_size=64 * 1024):
+    """
+    Yields the rows of an archived partition as dicts, decompressing
+    the stored file as it is read.
+    """
+    storage = storage or archive_storage()
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b''
+    with storage.open(archive.file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            pending += decompressor.decompress(chunk)
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                if line:
+                    yield json.loads(line)
+    pending += decompressor.flush()
+    for line in pending.split(b'\n'):
+        if line:
+            yield json.loads(line)
@@ -0,0 +1,148 @@
+"""
+Assignment of riders to shops.
+
+Every strategy answers with one indexed lookup, whatever the number of
+riders, and locks what it picks so concurrent approvals don't all land
+on the same rider. `Rider.active_shop_count` is kept in step with the
+shops a rider serves by `move_shops`, which is also used by the Shop
+signals for changes made elsewhere.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from jumga.apps.account.models import Rider
+from .cache import invalidate_storefronts
+
+
+def adjust_load(rider_id, delta):
+    if rider_id is None or not delta:
+        return
+    riders = Rider.objects.filter(id=rider_id)
+    if delta < 0:
+        riders = riders.filter(active_shop_count__gte=-delta)
+    riders.update(active_shop_count=F('active_shop_count') + delta)
+
+
+def move_shops(old_rider_id, new_rider_id, count=1):
+    """
+    Moves `count` active shops from one rider's load to another's.
+    Either side may be None.
+    """
+    if old_rider_id != new_rider_id:
+        adjust_load(old_rider_id, -count)
+        adjust_load(new_rider_id, count)
+
+
+def recount_rider_loads():
+    """
+    Recomputes every rider's active shop count from the shops.
+    """
+    Shop = apps.get_model('merchant', 'Shop')
+    shops = Shop.objects.filter(rider=OuterRef('pk'), is_active=True)\
+        .order_by().values('rider').annotate(count=Count('id')).values('count')
+    return Rider.objects.update(
+        active_shop_count=Coalesce(Subquery(shops), 0))
+
+
+def first_unlocked(riders):
+    """
+    The first rider of the (indexed) ordering that no concurrent
+    assignment has locked, or the first one if they all are.
+    """
+    return riders.select_for_update(skip_locked=True).first() or \
+        riders.select_for_update().first()
+
+
+class LeastLoaded:
+    """
+    The rider with the fewest active shops, ties going to the oldest.
+    """
+
+    def riders(self, shop):
+        return Rider.objects.all()
+
+    def pick(self, shop):
+        return first_unlocked(
+            self.riders(shop).order_by('active_shop_count', 'id'))
+
+
+class SameCountry(LeastLoaded):
+    """
+    The least loaded rider in the merchant's country, falling back to
+    the least loaded rider anywhere when the country has none.
+    """
+
+    def riders(self, shop):
+        return Rider.objects.filter(country_id=shop.user.country_id)
+
+    def pick(self, shop):
+        if shop.user.country_id is not None:
+            rider = super().pick(shop)
+            if rider is not None:
+                return rider
+        return LeastLoaded().pick(shop)
+
+
+class RoundRobin:
+    """
+    Riders in id order, one after the other. The position is kept in a
+    RiderCursor row, locked for the length of the assignment.
+    """
+    CURSOR = 'round_robin'
+
+    def pick(self, shop):
+        RiderCursor = apps.get_model('merchant', 'RiderCursor')
+        cursor, _ = RiderCursor.objects.select_for_update().get_or_create(
+            name=self.CURSOR)
+
+        riders = Rider.objects.order_by('id')
+        rider = riders.filter(id__gt=cursor.position).first() or riders.first()
+        if rider is not None:
+            cursor.position = rider.id
+            cursor.save(update_fields=['position'])
+        return rider
+
+
+STRATEGIES = {
+    'least_loaded': LeastLoaded,
+    'same_country': SameCountry,
+    'round_robin': RoundRobin,
+}
+
+
+def get_strategy(name=None):
+    return STRATEGIES[name or settings.RIDER_ASSIGNMENT_STRATEGY]()
+
+
+def assign_rider(shop_id, activate=False, strategy=None):
+    """
+    Gives the shop a rider picked by `strategy` (RIDER_ASSIGNMENT_STRATEGY
+    by default), activating it if asked. Returns the rider, or None when
+    there are no riders.
+    """
+    Shop = apps.get_model('merchant', 'Shop')
+    with transaction.atomic():
+        shop = Shop.objects.select_for_update(of=('self',))\
+            .select_related('user').get(id=shop_id)
+        rider = get_strategy(strategy).pick(shop)
+
+        is_active = shop.is_active or activate
+        Shop.objects.filter(id=shop.id).update(
+            rider=rider, is_active=is_active)
+        move_shops(shop.rider_id if shop.is_active else None,
+                   rider.id if rider is not None and is_active else None)
+        # update() skips the Shop receiver that drops the cached copy
+        invalidate_storefronts(shop.sub_domain)
+    return rider
+
+
+def reassign_riders(shop_ids, strategy=None):
+    """
+    Assigns a new rider to each shop, one at a time so every pick sees
+    the load left by the previous one. Returns {shop id: rider}.
+    """
+    return {shop_id: assign_rider(shop_id, strategy=strategy)
+            for shop_id in shop_ids}
@@ -0,0 +1,147 @@
+import re
+from itertools import islice
+
+from django.db import connection as default_connection, transaction
+from django.db.models.expressions import RawSQL
+
+
+def search_terms(query):
+    """
+    Splits a shopper's query into plain word tokens, dropping anything a
+    text search syntax could interpret as an operator.
+    """
+    return re.findall(r'\w+', query.lower())[:10]
+
+
+class PostgresSearchBackend:
+    """
+    Expression GIN index over to_tsvector(name || description), with a
+    pg_trgm index on name as a fallback for misspelt queries. Postgres
+    maintains both indexes itself, so there is nothing to do on save.
+    """
+    DOCUMENT = ("to_tsvector('simple', coalesce(\"product\".\"name\", '') "
+                "|| ' ' || coalesce(\"product\".\"description\", ''))")
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS product_search_idx ON product '
+                'USING gin ((%s))' % self.DOCUMENT)
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON product '
+                'USING gin (name gin_trgm_ops)')
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS product_search_idx')
+            cursor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+
+    def index_products(self, products):
+        pass
+
+    def index_queryset(self, queryset):
+        pass
+
+    def remove_products(self, ids):
+        pass
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX product_search_idx')
+            cursor.execute('REINDEX INDEX product_name_trgm_idx')
+
+    def filter(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+
+        tsquery = ' & '.join(term + ':*' for term in terms)
+        matches = queryset.extra(
+            where=[self.DOCUMENT + " @@ to_tsquery('simple', %s)"],
+            params=[tsquery])
+        if matches.exists():
+            return matches
+
+        # Nothing matched the words themselves, fall back to trigram
+        # similarity on the name so typos still find something.
+        return queryset.extra(
+            where=['"product"."name" %% %s'], params=[' '.join(terms)])
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 table keyed by product id. SQLite can't maintain it on its own,
+    so the Product signals call index_products/remove_products.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS product_fts '
+                'USING fts5(name, description)')
+        self.rebuild()
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS product_fts')
+
+    def index_products(self, products):
+        self.index_rows([(product.id, product.name, product.description)
+                         for product in products])
+
+    def index_queryset(self, queryset):
+        """
+        Indexes the products of a queryset in chunks, for rows written
+        with bulk_create where no signal fires.
+        """
+        rows = queryset.values_list('id', 'name', 'description').iterator()
+        for chunk in iter(lambda: list(islice(rows, 1000)), []):
+            self.index_rows(chunk)
+
+    def index_rows(self, rows):
+        with transaction.atomic(using=self.connection.alias), \
+                self.connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT OR REPLACE INTO product_fts (rowid, name, description) '
+                'VALUES (%s, %s, %s)', rows)
+
+    def remove_products(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                'DELETE FROM product_fts WHERE rowid = %s',
+                [(id,) for id in ids])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM product_fts')
+            cursor.execute(
+                'INSERT INTO product_fts (rowid, name, description) '
+                'SELECT id, name, description FROM product')
+
+    def filter(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+
+        match = ' '.join('"%s"*' % term for term in terms)
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM product_fts WHERE product_fts MATCH %s',
+            [match]))
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS[connection.vendor](connection)
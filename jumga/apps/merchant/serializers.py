@@ -3,20 +3,40 @@ from rest_framework import serializers
 from six import text_type
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from .models import Shop, ShopCategory, Product, Order, OrderedItem, Transaction, Payment
+from .models import Shop, ShopCategory, Product, Order, OrderedItem, Transaction, Payment, ArchivedPartition
 from django.db import transaction, IntegrityError
+from django.db.models import Prefetch
+from .images import derivative_urls
+from .uploads import UPLOAD_TARGETS, CONTENT_TYPES
+from .orders import merge_cart, order_totals
+from .exports import CSV, NDJSON
+from jumga.apps.account.serializers import MerchantSerializer, UserSerializer
+from jumga.serializers import DynamicFieldsMixin
 
 User = get_user_model()
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class SrcsetField(serializers.ReadOnlyField):
+    """
+    Turns stored image derivative names into {size: {format: url}}.
+    """
+
+    def to_representation(self, value):
+        return derivative_urls(value)
+
+
+class ShopSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     rider = serializers.ReadOnlyField(source='rider_full_name')
+    logo_srcset = SrcsetField(source='logo_derivatives')
+    banner_image_srcset = SrcsetField(source='banner_image_derivatives')
 
     class Meta:
         model = Shop
         fields = ['id', 'user', 'name', 'rider', 'description', 'sub_domain', 'delivery_fee',
-                  'logo', 'banner_image', 'is_active']
+                  'logo', 'banner_image', 'logo_srcset', 'banner_image_srcset', 'is_active']
+        expandable = {'user': (MerchantSerializer, ('user',))}
+        select_related = {'rider': ('rider',)}
 
     def update(self, instance, validated_data):
         # prevent fields from being updated
@@ -24,29 +44,144 @@ class ShopSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class ShopCategorySerializer(serializers.ModelSerializer):
+class ShopCategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = ShopCategory
         fields = ['id', 'name', 'slug', 'shop', 'is_active', 'created_at']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ArchivedPartitionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ArchivedPartition
+        fields = ['id', 'table_name', 'period', 'row_count', 'created_at']
+
+
+class ShopNestedSerializer(serializers.ModelSerializer):
+    country = serializers.ReadOnlyField(source='country_data')
+
+    class Meta:
+        model = Shop
+        fields = ['id', 'name', 'country']
+
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    image_srcset = SrcsetField(source='image_derivatives')
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'price', 'description', 'image', 'shop', 'slug',
+        fields = ['id', 'name', 'price', 'description', 'image', 'image_srcset', 'shop', 'slug',
                   'shopcategory', 'is_active', 'updated_at', 'created_at', ]
+        expandable = {
+            'shop': (ShopNestedSerializer, ('shop__user__country',)),
+            'shopcategory': (ShopCategorySerializer, ('shopcategory',)),
+        }
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """
+    Validates one row of a bulk product import. The shop comes from the
+    import itself and categories are checked against the set passed in
+    the context, so validating a row never queries the database.
+    """
+    shopcategory = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Product
+        fields = ['name', 'price', 'description', 'shopcategory', 'is_active']
+
+    def validate_shopcategory(self, value):
+        if value is not None and value not in self.context['categories']:
+            raise serializers.ValidationError(
+                _('Invalid category "%s" for this shop.') % value)
+        return value
+
+
+class ProductBulkFilterSerializer(serializers.Serializer):
+    shopcategory = serializers.IntegerField(required=False, allow_null=True)
+    is_active = serializers.BooleanField(required=False)
+
+
+class ProductBulkChangeSerializer(serializers.Serializer):
+    price_percent = serializers.DecimalField(
+        max_digits=6, decimal_places=2, min_value=-100, required=False)
+    is_active = serializers.BooleanField(required=False)
+    shopcategory = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate_shopcategory(self, value):
+        if value is not None and not ShopCategory.objects.filter(
+                id=value, shop=self.context['shop']).exists():
+            raise serializers.ValidationError(
+                _('Invalid category "%s" for this shop.') % value)
+        return value
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError(_('No changes were given.'))
+        return data
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Products are picked either by `ids` or by `filters`, within the shop
+    given in the context.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, max_length=10000)
+    filters = ProductBulkFilterSerializer(required=False)
+    changes = ProductBulkChangeSerializer()
+
+    def validate(self, data):
+        if 'ids' not in data and 'filters' not in data:
+            raise serializers.ValidationError(
+                _('Either ids or filters must be given.'))
+        return data
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    """
+    Query parameters of a shop's product listing.
+    """
+    NEWEST = 'newest'
+    PRICE = 'price'
+    PRICE_DESC = '-price'
+
+    ORDERINGS = {
+        NEWEST: '-id',
+        PRICE: ('price', 'id'),
+        PRICE_DESC: ('-price', '-id'),
+    }
+
+    category = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(
+        required=False, allow_null=True, default=None)
+    min_price = serializers.IntegerField(required=False, min_value=0)
+    max_price = serializers.IntegerField(required=False, min_value=0)
+    sort = serializers.ChoiceField(
+        choices=list(ORDERINGS), required=False, default=NEWEST)
+
+
+class ProductSearchSerializer(serializers.Serializer):
+    """
+    Query parameters of the cross shop product search.
+    """
+    q = serializers.CharField(max_length=100)
+    country = serializers.IntegerField(required=False)
+    category = serializers.SlugField(required=False)
 
 
 class ShopAndProductsSerializer(serializers.ModelSerializer):
     country = serializers.ReadOnlyField(source='country_data')
     products = ProductSerializer(many=True, read_only=True)
+    logo_srcset = SrcsetField(source='logo_derivatives')
+    banner_image_srcset = SrcsetField(source='banner_image_derivatives')
 
     class Meta:
         model = Shop
         fields = ['id', 'user', 'name', 'description', 'sub_domain', 'delivery_fee',
-                  'logo', 'banner_image', 'is_active', 'country', 'products']
+                  'logo', 'banner_image', 'logo_srcset', 'banner_image_srcset',
+                  'is_active', 'country', 'products']
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -58,26 +193,39 @@ class PaymentSerializer(serializers.ModelSerializer):
                   'tx_ref', 'payment_type', 'order',
                   'updated_at', 'created_at']
 
+    def create(self, validated_data):
+        # The ledger outbox row is written by the post_save receiver and
+        # has to commit or roll back together with the payment.
+        with transaction.atomic():
+            return super().create(validated_data)
+
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionPaymentSerializer(serializers.ModelSerializer):
 
     class Meta:
-        model = Transaction
-        fields = ['id', 'amount', 'currency', 'beneficiary', 'transaction_id',
-                  'transaction_type', 'tx_ref_from_payment', 'narration', 'created_at']
-        depth = 1
+        model = Payment
+        fields = ['id', 'amount', 'currency', 'merchant', 'shop',
+                  'status', 'flw_ref', 'transaction_id',
+                  'tx_ref', 'payment_type', 'order', 'narration',
+                  'updated_at', 'created_at']
 
 
-class ShopNestedSerializer(serializers.ModelSerializer):
-    country = serializers.ReadOnlyField(source='country_data')
+class TransactionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    beneficiary = UserSerializer(read_only=True)
+    tx_ref_from_payment = TransactionPaymentSerializer(read_only=True)
 
     class Meta:
-        model = Shop
-        fields = ['id', 'name', 'country']
+        model = Transaction
+        fields = ['id', 'amount', 'currency', 'beneficiary', 'transaction_id',
+                  'transaction_type', 'tx_ref_from_payment', 'narration', 'created_at']
+        select_related = {
+            'beneficiary': ('beneficiary',),
+            'tx_ref_from_payment': ('tx_ref_from_payment',),
+        }
 
 
-class CustomerOrdersSerializer(serializers.ModelSerializer):
-    total_amount = serializers.ReadOnlyField(source='get_total_cost')
+class CustomerOrdersSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    total_amount = serializers.ReadOnlyField(source='total')
     shop = ShopNestedSerializer()
 
     class Meta:
@@ -85,37 +233,77 @@ class CustomerOrdersSerializer(serializers.ModelSerializer):
         fields = ['id', 'shop', 'customer_email', 'customer_city',
                   'status', 'total_amount', 'reference_id', 'created_at']
         depth = 1
+        select_related = {'shop': ('shop__user__country',)}
 
 
-class MerchantOrdersSerializer(serializers.ModelSerializer):
-    total_amount = serializers.ReadOnlyField(source='get_total_cost')
-    shop = ShopNestedSerializer()
+class OrderedProductSerializer(serializers.ModelSerializer):
+    image_srcset = SrcsetField(source='image_derivatives')
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'image', 'image_srcset', 'slug',
+                  'shopcategory', 'is_active']
+
+
+class OrderedItemReadSerializer(serializers.ModelSerializer):
+    product = OrderedProductSerializer(read_only=True)
+
+    class Meta:
+        model = OrderedItem
+        fields = ['id', 'product', 'quantity', 'item_price']
+
+
+class MerchantOrdersSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    total_amount = serializers.ReadOnlyField(source='total')
+    shop = ShopNestedSerializer(read_only=True)
+    items = OrderedItemReadSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'shop', 'customer_name', 'customer_contact', 'customer_email', 'customer_city',
                   'status', 'total_amount', 'reference_id', 'items', 'created_at']
-        depth = 2
+        select_related = {'shop': ('shop__user__country',)}
+        prefetch_related = {
+            'items': (Prefetch('items', OrderedItem.objects.select_related('product')),),
+        }
 
 
-class ExtraFieldSerializer(serializers.Field):
-    def to_internal_value(self, data):
-        return data
+class OrderStatusTransitionSerializer(serializers.Serializer):
+    """
+    Orders to move to `status`. Only delivery and cancellation can be
+    set by hand, payment comes from the ledger posting.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=[
+        (Order.DELIVERED, 'delivered'),
+        (Order.CANCELLED, 'cancelled'),
+    ])
 
-    def get_attribute(self, instance):
-        return instance
 
-    def to_representation(self, value):
-        """
-        Serialize the value's class name.
-        """
-        return value.__class__.__name__
+class RiderOrderStatusTransitionSerializer(OrderStatusTransitionSerializer):
+    """
+    Riders can only mark orders delivered.
+    """
+    status = serializers.ChoiceField(choices=[
+        (Order.DELIVERED, 'delivered'),
+    ])
+
+
+class CartItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartQuoteSerializer(serializers.Serializer):
+    shop = serializers.IntegerField()
+    cart = CartItemSerializer(many=True, allow_empty=False)
 
 
 class OrderSerializer(serializers.ModelSerializer):
 
-    cart = ExtraFieldSerializer()
-    total_amount = serializers.ReadOnlyField(source='get_total_cost')
+    cart = CartItemSerializer(many=True, allow_empty=False, write_only=True)
+    total_amount = serializers.ReadOnlyField(source='total')
     reference_id = serializers.ReadOnlyField()
 
     class Meta:
@@ -125,7 +313,37 @@ class OrderSerializer(serializers.ModelSerializer):
                   'customer_instruction', 'updated_at', 'created_at',
                   'cart', 'total_amount', 'reference_id']
 
+    def validate(self, data):
+        """
+        Resolves the whole cart with one query. Prices always come from
+        the database, never from the client, and every product has to
+        be an active product of the shop the order is placed with.
+        """
+        quantities = merge_cart(data['cart'])
+
+        products = Product.objects.filter(
+            shop=data['shop'], is_active=True).only('id', 'price')\
+            .in_bulk(list(quantities))
+        missing = [id for id in quantities if id not in products]
+        if missing:
+            raise serializers.ValidationError({'cart': [
+                _('Product "%s" is not available in this shop.') % id
+                for id in missing]})
+
+        data['cart'] = [(products[id], quantity)
+                        for id, quantity in quantities.items()]
+        return data
+
     def create(self, validated_data):
+        items = [
+            OrderedItem(product=product, quantity=quantity, item_price=product.price)
+            for product, quantity in validated_data['cart']
+        ]
+        # The totals are known before anything is written, so the order
+        # row is inserted with them and receivers never see it at 0.
+        subtotal, delivery_fee, total = order_totals(
+            items, validated_data['shop'].delivery_fee)
+
         with transaction.atomic():
             order = Order.objects.create(
                 shop=validated_data['shop'],
@@ -135,22 +353,51 @@ class OrderSerializer(serializers.ModelSerializer):
                 customer_address=validated_data['customer_address'],
                 customer_city=validated_data['customer_city'],
                 customer_instruction=validated_data['customer_instruction'],
+                subtotal=subtotal,
+                delivery_fee=delivery_fee,
+                total=total,
             )
-            cart = validated_data.pop('cart')
-
-            for item in cart:
-                # This query below is to get exact price incase
-                #  you do not trust the price sent to
-                # you by the front end. If you do, comment this line below  and
-                # replace product.price with item['price]
-                product = Product.objects.get(id=item['id'])
-                OrderedItem.objects.create(
-                    order=order,
-                    product_id=item['id'],
-                    quantity=item['quantity'],
-                    item_price=product.price,
-                )
-
-            print(cart)
+
+            for item in items:
+                item.order = order
+            OrderedItem.objects.bulk_create(items)
 
         return order
+
+
+class UploadRequestSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=list(UPLOAD_TARGETS))
+    content_type = serializers.ChoiceField(choices=list(CONTENT_TYPES))
+
+
+class UploadConfirmSerializer(serializers.Serializer):
+    upload_token = serializers.CharField()
+    id = serializers.IntegerField()
+
+
+class ExportSerializer(serializers.Serializer):
+    """
+    Query parameters of the export endpoints. `type` rather than
+    `format`, which DRF keeps for content negotiation.
+    """
+    type = serializers.ChoiceField(choices=[CSV, NDJSON], default=CSV)
+    gzip = serializers.BooleanField(default=False)
+
+
+class StatementQuerySerializer(serializers.Serializer):
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('since') and data.get('until') and data['since'] > data['until']:
+            raise serializers.ValidationError(
+                {"until": _("Must not be before since.")})
+        return data
+
+
+class StatementDaySerializer(serializers.Serializer):
+    day = serializers.DateField()
+    currency = serializers.CharField()
+    credit = serializers.DecimalField(max_digits=18, decimal_places=2)
+    debit = serializers.DecimalField(max_digits=18, decimal_places=2)
+    entries = serializers.IntegerField()
@@ -0,0 +1,140 @@
+import logging
+from smtplib import SMTPException
+
+from PIL import Image, UnidentifiedImageError
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_storefronts
+from .images import derivative_files, generate_derivatives
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=5)
+def generate_image_derivatives(model, pk, field):
+    """
+    Builds the resized WebP/JPEG versions of `field` on a Shop or
+    Product and records their names in `<field>_derivatives`, then
+    deletes the files of the derivatives they replace.
+    """
+    Model = apps.get_model('merchant', model)
+    instance = Model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+
+    name = getattr(instance, field).name
+    if not name:
+        return
+
+    try:
+        derivatives = generate_derivatives(name)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        # Not an image we can read, retrying won't change that. The
+        # source is still recorded so later saves don't queue it again.
+        # Storage errors are left to autoretry.
+        logger.warning('Skipping derivatives of %s %s %s, unreadable image %s',
+                       model, pk, field, name, exc_info=True)
+        derivatives = {'source': name}
+
+    with transaction.atomic():
+        current = Model.objects.select_for_update().filter(pk=pk)\
+            .values(field, field + '_derivatives').first()
+        current_files = derivative_files(current and current[field + '_derivatives'])
+        # Only store them if the image wasn't replaced in the meantime, the
+        # newer upload has a task of its own.
+        updated = current is not None and current[field] == name
+        if updated:
+            Model.objects.filter(pk=pk).update(**{field + '_derivatives': derivatives})
+            stale = current_files - derivative_files(derivatives)
+        else:
+            stale = derivative_files(derivatives) - current_files
+
+    if updated:
+        Shop = apps.get_model('merchant', 'Shop')
+        shop_id = pk if Model is Shop else instance.shop_id
+        invalidate_storefronts(*Shop.objects.filter(
+            id=shop_id).values_list('sub_domain', flat=True))
+
+    # Nothing refers to these any more, a file that can't be deleted is
+    # only left behind.
+    for stale_name in stale:
+        try:
+            default_storage.delete(stale_name)
+        except Exception:
+            logger.warning('Could not delete derivative %s', stale_name, exc_info=True)
+
+
+# Set while a process_webhook_events batch is scheduled
+WEBHOOK_INBOX_KEY = 'webhook-inbox-scheduled'
+
+
+def digest_key(recipient):
+    return 'notification-digest:%s' % recipient
+
+
+def render_digest(notifications):
+    lines = ['%s: %s, %s %s' % (
+        notification.get_event_display(), notification.order.reference_id,
+        notification.order.total, notification.order.customer_name)
+        for notification in notifications]
+    if len(notifications) == 1:
+        subject = '%s: %s' % (notifications[0].get_event_display(),
+                              notifications[0].order.reference_id)
+    else:
+        subject = '%s order updates' % len(notifications)
+    return subject, '\n'.join(lines)
+
+
+@shared_task(autoretry_for=(SMTPException, OSError), retry_backoff=True, max_retries=5)
+def send_notification_digest(recipient):
+    """
+    Emails every pending notification of `recipient` as one message and
+    marks them sent. A failed send rolls back and the task retries.
+    """
+    # Events queued from now on schedule a digest of their own
+    cache.delete(digest_key(recipient))
+
+    Notification = apps.get_model('merchant', 'Notification')
+    with transaction.atomic():
+        pending = list(Notification.objects.select_for_update(skip_locked=True, of=('self',))
+                       .filter(recipient=recipient, sent_at__isnull=True)
+                       .select_related('order').order_by('id'))
+        if not pending:
+            return 0
+
+        subject, message = render_digest(pending)
+        send_mail(subject, message, settings.EMAIL_FROM, [recipient])
+        Notification.objects.filter(id__in=[n.id for n in pending])\
+            .update(sent_at=timezone.now())
+    return len(pending)
+
+
+@shared_task
+def process_ledger_outbox():
+    """
+    Posts the pending ledger outbox. Any number of these can run at
+    once, each one only takes the rows nobody else has locked.
+    """
+    # ledger imports the models, which import this module
+    from .ledger import drain
+    return drain()
+
+
+@shared_task
+def process_webhook_events():
+    """
+    Creates the payments of the webhook events in the inbox.
+    """
+    # Events received from now on schedule a batch of their own
+    cache.delete(WEBHOOK_INBOX_KEY)
+
+    # webhooks imports the models, which import this module
+    from .webhooks import drain
+    return drain()
@@ -1,3 +1,338 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+import uuid
+from decimal import Decimal as D
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+
+from jumga.apps.account.models import Country, Merchant, Rider, User
+from . import cache as merchant_cache, images
+from .ledger import LedgerError, drain, post_payment
+from .models import (LedgerOutbox, Notification, Order, OrderedItem, Payment, Product, Shop,
+                     Transaction, schedule_image_derivatives)
+from .notifications import schedule_digests
+from .orders import backfill_order_totals
+from .serializers import OrderSerializer
+from .tasks import generate_image_derivatives, send_notification_digest
+
+
+def clear_caches():
+    """
+    Empties the shared cache and every worker local tier, which outlive
+    the rolled back test transactions.
+    """
+    cache.clear()
+    for tiered in (merchant_cache.storefronts, merchant_cache.shop_hosts,
+                   merchant_cache.shop_quotes, merchant_cache.product_prices,
+                   merchant_cache.platform_accounts):
+        tiered.local.clear()
+
+
+class MerchantTestCase(TestCase):
+    """
+    A Nigerian merchant with one active shop, its rider, two products
+    and the platform account.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.country = Country.objects.create(
+            name='Nigeria', short_name='NG', currency='NGN')
+        self.platform = User.objects.create_user(
+            settings.JUMGA_PLATFORM_EMAIL, 'password')
+        self.merchant = Merchant.objects.create(
+            user=User.objects.create_user('merchant@example.com', 'password'),
+            country=self.country)
+        self.rider = Rider.objects.create(
+            user=User.objects.create_user('rider@example.com', 'password'),
+            country=self.country)
+        self.shop = Shop.objects.create(
+            user=self.merchant, rider=self.rider, name='Corner Shop',
+            delivery_fee=20, is_active=True)
+        self.apple = Product.objects.create(shop=self.shop, name='Apple', price=100)
+        self.pear = Product.objects.create(shop=self.shop, name='Pear', price=35)
+
+    def order_data(self, cart, **data):
+        return dict({
+            'shop': self.shop.id,
+            'customer_name': 'Ada',
+            'customer_email': 'ada@example.com',
+            'customer_contact': '08012345678',
+            'customer_address': '1 Marina',
+            'customer_city': 'Lagos',
+            'customer_instruction': '',
+            'cart': cart,
+        }, **data)
+
+    def create_order(self, cart, **data):
+        serializer = OrderSerializer(data=self.order_data(cart, **data))
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def pay(self, order=None, **fields):
+        """
+        A successful payment for `order`, or the shop's approval fee.
+        """
+        reference = uuid.uuid4().hex
+        payment = {'status': 'successful', 'flw_ref': 'FLW-' + reference,
+                   'transaction_id': reference, 'tx_ref': 'ref-' + reference,
+                   'shop': self.shop, 'merchant': self.merchant}
+        if order is not None:
+            payment.update(amount=order.total, currency=Payment.NGN,
+                           payment_type=Payment.SALE, order=order)
+        else:
+            payment.update(amount=D('20.00'), currency=Payment.USD,
+                           payment_type=Payment.APPROVAL)
+        payment.update(fields)
+        return Payment.objects.create(**payment)
+
+
+class OrderTotalsTests(MerchantTestCase):
+
+    def test_totals_are_stored_at_checkout(self):
+        order = self.create_order([
+            {'id': self.apple.id, 'quantity': 2},
+            {'id': self.pear.id, 'quantity': 1},
+            {'id': self.apple.id, 'quantity': 1},
+        ])
+
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, D('335.00'))
+        self.assertEqual(order.delivery_fee, D('20.00'))
+        self.assertEqual(order.total, D('355.00'))
+        self.assertEqual(
+            dict(order.items.values_list('product_id', 'quantity')),
+            {self.apple.id: 3, self.pear.id: 1})
+
+    def test_prices_come_from_the_database(self):
+        order = self.create_order([{'id': self.pear.id, 'quantity': 2}],
+                                  total_amount='1.00')
+        self.assertEqual(order.total, D('90.00'))
+
+    def test_post_save_sees_the_final_total(self):
+        seen = []
+
+        def receiver(sender, instance, created, **kwargs):
+            seen.append((created, instance.total))
+
+        post_save.connect(receiver, sender=Order)
+        try:
+            self.create_order([{'id': self.apple.id, 'quantity': 1}])
+        finally:
+            post_save.disconnect(receiver, sender=Order)
+        self.assertEqual(seen, [(True, D('120'))])
+
+    def test_backfill_recomputes_totals(self):
+        order = self.create_order([{'id': self.apple.id, 'quantity': 2}])
+        Order.objects.filter(id=order.id).update(subtotal=0, delivery_fee=0, total=0)
+        OrderedItem.objects.filter(order=order).update(quantity=3)
+
+        backfill_order_totals(batch_size=1)
+
+        order.refresh_from_db()
+        self.assertEqual((order.subtotal, order.delivery_fee, order.total),
+                         (D('300.00'), D('20.00'), D('320.00')))
+
+
+class LedgerLegTests(MerchantTestCase):
+
+    def legs(self, payment):
+        return sorted(Transaction.objects.filter(tx_ref_from_payment=payment)
+                      .values_list('beneficiary__email', 'amount', 'currency',
+                                   'transaction_type', 'narration'))
+
+    def test_sale_splits_between_platform_merchant_and_rider(self):
+        order = self.create_order([{'id': self.apple.id, 'quantity': 3},
+                                   {'id': self.pear.id, 'quantity': 1}])
+        payment = self.pay(order)
+
+        posted = post_payment(payment)
+
+        self.assertEqual(len(posted), 4)
+        self.assertEqual(self.legs(payment), [
+            (settings.JUMGA_PLATFORM_EMAIL, D('4.00'), 'NGN', 'credit', 'Earnings on Delivery'),
+            (settings.JUMGA_PLATFORM_EMAIL, D('8.71'), 'NGN', 'credit', 'Earnings on Sales'),
+            ('merchant@example.com', D('326.29'), 'NGN', 'credit', 'Earnings on Sales'),
+            ('rider@example.com', D('16.00'), 'NGN', 'credit', 'Earnings on Delivery'),
+        ])
+        self.assertEqual(len({leg.transaction_id for leg in posted}), 4)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.paid), (Order.PAYMENT_MADE, True))
+
+    def test_approval_credits_the_platform(self):
+        payment = self.pay()
+        post_payment(payment)
+        self.assertEqual(self.legs(payment), [
+            (settings.JUMGA_PLATFORM_EMAIL, D('20.00'), 'USD', 'credit',
+             'Earnings on Shop Approval'),
+        ])
+
+    def test_posting_again_is_harmless(self):
+        payment = self.pay(self.create_order([{'id': self.apple.id, 'quantity': 1}]))
+        post_payment(payment)
+        self.assertEqual(post_payment(payment), [])
+        self.assertEqual(Transaction.objects.filter(tx_ref_from_payment=payment).count(), 4)
+
+    def test_sale_without_rider_is_refused(self):
+        order = self.create_order([{'id': self.apple.id, 'quantity': 1}])
+        Shop.objects.filter(id=self.shop.id).update(rider=None)
+        with self.assertRaises(LedgerError):
+            post_payment(Payment.objects.get(id=self.pay(order).id))
+
+    def test_drain_posts_the_outbox_and_records_failures(self):
+        posted = self.pay(self.create_order([{'id': self.apple.id, 'quantity': 1}]))
+        failing = self.pay(self.create_order([{'id': self.pear.id, 'quantity': 1}]))
+        Order.objects.filter(id=failing.order_id).update(shop=Shop.objects.create(
+            user=self.merchant, name='No Rider', delivery_fee=20))
+
+        with self.assertLogs('jumga.apps.merchant.ledger', 'ERROR'):
+            self.assertEqual(drain(), (1, 1))
+
+        self.assertEqual(Transaction.objects.filter(tx_ref_from_payment=posted).count(), 4)
+        self.assertFalse(Transaction.objects.filter(tx_ref_from_payment=failing).exists())
+        outbox = LedgerOutbox.objects.get(payment=failing)
+        self.assertEqual(outbox.attempts, 1)
+        self.assertIsNone(outbox.processed_at)
+        self.assertIn('LedgerError', outbox.last_error)
+        self.assertIsNotNone(outbox.next_attempt_at)
+
+
+class NotificationDigestTests(MerchantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.orders = [self.create_order([{'id': self.apple.id, 'quantity': quantity}])
+                       for quantity in (1, 2, 3)]
+
+    def test_one_digest_is_scheduled_per_recipient(self):
+        with mock.patch.object(send_notification_digest, 'apply_async') as apply_async:
+            schedule_digests({'merchant@example.com'})
+            schedule_digests({'merchant@example.com'})
+            schedule_digests({'merchant@example.com', 'other@example.com'})
+
+        self.assertEqual(sorted(call.args for call in apply_async.call_args_list), [
+            (('merchant@example.com',),), (('other@example.com',),)])
+        self.assertEqual(apply_async.call_args.kwargs['countdown'],
+                         settings.NOTIFICATION_DIGEST_DELAY)
+
+    def test_pending_events_are_sent_as_one_email(self):
+        self.assertEqual(send_notification_digest('merchant@example.com'), 3)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['merchant@example.com'])
+        self.assertEqual(mail.outbox[0].subject, '3 order updates')
+        for order in self.orders:
+            self.assertIn(order.reference_id, mail.outbox[0].body)
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+
+        self.assertEqual(send_notification_digest('merchant@example.com'), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_a_single_event_is_named_in_the_subject(self):
+        Notification.objects.exclude(order=self.orders[0]).delete()
+        send_notification_digest('merchant@example.com')
+        self.assertEqual(mail.outbox[0].subject,
+                         'Order created: %s' % self.orders[0].reference_id)
+
+    def test_sending_clears_the_schedule(self):
+        with mock.patch.object(send_notification_digest, 'apply_async') as apply_async:
+            schedule_digests({'merchant@example.com'})
+            send_notification_digest('merchant@example.com')
+            schedule_digests({'merchant@example.com'})
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_failed_send_keeps_the_events_pending(self):
+        with mock.patch('jumga.apps.merchant.tasks.send_mail', side_effect=SMTPException):
+            with self.assertRaises(SMTPException):
+                send_notification_digest('merchant@example.com')
+        self.assertEqual(Notification.objects.filter(sent_at__isnull=True).count(), 3)
+
+
+class ImageDerivativeTests(MerchantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        storage = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+            MEDIA_ROOT=media_root)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+    def upload(self, name, content=None):
+        if content is None:
+            buffer = io.BytesIO()
+            Image.new('RGBA', (1600, 800), (200, 30, 30, 128)).save(buffer, 'PNG')
+            content = buffer.getvalue()
+        name = default_storage.save(name, ContentFile(content))
+        Product.objects.filter(id=self.apple.id).update(image=name)
+        return name
+
+    def derivatives(self):
+        return Product.objects.get(id=self.apple.id).image_derivatives
+
+    def test_every_size_and_format_is_stored(self):
+        name = self.upload('shop/apple.png')
+        generate_image_derivatives('Product', self.apple.id, 'image')
+
+        derivatives = self.derivatives()
+        self.assertEqual(derivatives['source'], name)
+        self.assertEqual(set(derivatives) - {'source'}, set(images.DERIVATIVE_SIZES))
+        for size, edge in images.DERIVATIVE_SIZES.items():
+            self.assertEqual(set(derivatives[size]), set(images.DERIVATIVE_FORMATS))
+            for stored in derivatives[size].values():
+                with default_storage.open(stored) as f:
+                    self.assertEqual(max(Image.open(f).size), edge)
+
+    def test_replaced_image_drops_the_old_derivatives(self):
+        self.upload('shop/apple.png')
+        generate_image_derivatives('Product', self.apple.id, 'image')
+        old = images.derivative_files(self.derivatives())
+
+        self.upload('shop/apple-2.png')
+        generate_image_derivatives('Product', self.apple.id, 'image')
+
+        new = images.derivative_files(self.derivatives())
+        self.assertFalse(old & new)
+        self.assertFalse(any(default_storage.exists(stored) for stored in old))
+        self.assertTrue(all(default_storage.exists(stored) for stored in new))
+
+    def test_image_replaced_while_generating_keeps_the_newer_upload(self):
+        self.upload('shop/apple.png')
+        generate = images.generate_derivatives
+
+        def replace_meanwhile(name):
+            derivatives = generate(name)
+            self.upload('shop/apple-2.png')
+            return derivatives
+
+        with mock.patch('jumga.apps.merchant.tasks.generate_derivatives',
+                        side_effect=replace_meanwhile):
+            generate_image_derivatives('Product', self.apple.id, 'image')
+
+        # The newer upload has a task of its own, what was written for the
+        # old one is deleted
+        self.assertEqual(self.derivatives(), {})
+        self.assertEqual(default_storage.listdir('shop/derivatives')[1], [])
+
+    def test_unreadable_image_is_recorded_and_not_queued_again(self):
+        name = self.upload('shop/apple.png', b'not an image')
+        with self.assertLogs('jumga.apps.merchant.tasks', 'WARNING'):
+            generate_image_derivatives('Product', self.apple.id, 'image')
+
+        self.assertEqual(self.derivatives(), {'source': name})
+        with mock.patch.object(transaction, 'on_commit') as on_commit:
+            schedule_image_derivatives(Product.objects.get(id=self.apple.id), 'image')
+        on_commit.assert_not_called()
@@ -0,0 +1,56 @@
+import posixpath
+import uuid
+
+from django.core import signing
+from django.core.files.storage import default_storage
+
+from .models import Shop, Product
+
+# What a direct upload can be attached to: "<model>.<image field>"
+UPLOAD_TARGETS = {
+    'shop.logo': (Shop, 'logo'),
+    'shop.banner_image': (Shop, 'banner_image'),
+    'product.image': (Product, 'image'),
+}
+
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
+UPLOAD_EXPIRES = 15 * 60
+
+TOKEN_SALT = 'jumga.apps.merchant.uploads'
+TOKEN_MAX_AGE = 24 * 60 * 60
+
+
+def issue_upload(target, content_type):
+    """
+    Picks a fresh storage key under the field's upload_to and returns the
+    presigned post for it, plus a signed token the client hands back to
+    confirm_upload once the file is in the bucket.
+    """
+    model, field = UPLOAD_TARGETS[target]
+    upload_to = model._meta.get_field(field).upload_to
+    key = posixpath.join(
+        upload_to, uuid.uuid4().hex + CONTENT_TYPES[content_type])
+
+    upload = default_storage.presigned_post(
+        key, content_type, MAX_UPLOAD_SIZE, expires_in=UPLOAD_EXPIRES)
+    upload['key'] = key
+    upload['upload_token'] = signing.dumps(
+        {'target': target, 'key': key}, salt=TOKEN_SALT)
+    return upload
+
+
+def read_upload_token(token):
+    """
+    Returns (target, key) of an issued upload, raises signing.BadSignature
+    for forged or expired tokens.
+    """
+    data = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    return data['target'], data['key']
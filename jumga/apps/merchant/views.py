@@ -1,22 +1,42 @@
+import hashlib
+import json
+
 from django.contrib.auth import get_user_model
 from rest_framework import generics, permissions, status, response, decorators
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication, TokenAuthentication
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 from django.conf import settings
 from django.core.mail import send_mail
-from .serializers import ShopSerializer, ShopAndProductsSerializer, ShopCategorySerializer, ProductSerializer, PaymentSerializer, OrderSerializer, CustomerOrdersSerializer, MerchantOrdersSerializer, TransactionSerializer
+from django.core import signing
+from django.core.files.storage import default_storage
+from .serializers import ShopSerializer, ShopAndProductsSerializer, ShopCategorySerializer, ProductSerializer, ProductSearchSerializer, ProductFilterSerializer, ProductBulkUpdateSerializer, UploadRequestSerializer, UploadConfirmSerializer, PaymentSerializer, OrderSerializer, CustomerOrdersSerializer, MerchantOrdersSerializer, TransactionSerializer, ExportSerializer, OrderStatusTransitionSerializer, RiderOrderStatusTransitionSerializer, ArchivedPartitionSerializer, CartQuoteSerializer, StatementQuerySerializer, StatementDaySerializer
 from django.contrib.auth.models import update_last_login
 from django.utils import timezone
+from django.db.models import F, Value, DecimalField, ExpressionWrapper
+from django.db.models.functions import Round
 
 from jumga.permissions import IsOwnerOrReadOnly
 from jumga.access import encoded_reset_token, decode_reset_token
-from .models import Shop, ShopCategory, Product, Order, Transaction
+from jumga.pagination import IdCursorPagination, KeysetCursorPagination
+from jumga.serializers import sparse_fields
+from jumga.idempotency import idempotent
+from .models import Shop, ShopCategory, Product, Order, Transaction, ArchivedPartition, schedule_image_derivatives
+from .cache import storefronts, invalidate_storefronts, invalidate_shop_prices, invalidate_product_prices
+from .search import get_backend as get_search_backend
+from .importer import ProductImporter, detect_type, read_rows
+from .uploads import UPLOAD_TARGETS, issue_upload, read_upload_token
+from .exports import ORDER_COLUMNS, TRANSACTION_COLUMNS, export_response
+from .orders import customer_lookup_key, quote_cart, transition_orders
+from .partitions import read_archive
+from .ledger import balance_currencies, balances, statement
+from .webhooks import event_from_payload, receive, verify_signature
 
 User = get_user_model()
 
@@ -28,17 +48,15 @@ class ShopListView(APIView):
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, id):
-        shop = Shop.objects.filter(
-            user__user__id=id).order_by('-id')
+        fields, expand = sparse_fields(request)
+        shop = ShopSerializer.optimize_queryset(
+            Shop.objects.filter(user__user__id=id), fields, expand)
 
-        if shop:
-            serializer = ShopSerializer(shop, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(shop, request, view=self)
+        serializer = ShopSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ShopNewView(APIView):
@@ -67,7 +85,8 @@ class ShopDetailView(APIView):
 
     def get(self, request, id):
         shop = self.get_object(id)
-        serializer = ShopSerializer(shop)
+        fields, expand = sparse_fields(request)
+        serializer = ShopSerializer(shop, fields=fields, expand=expand)
         return Response(serializer.data)
 
     def put(self, request, id):
@@ -86,17 +105,15 @@ class ShopCategoriesListView(APIView):
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, shop_id):
-        shopcategory = ShopCategory.objects.filter(
-            shop=shop_id).order_by('-id')
+        fields, expand = sparse_fields(request)
+        shopcategory = ShopCategorySerializer.optimize_queryset(
+            ShopCategory.objects.filter(shop=shop_id), fields, expand)
 
-        if shopcategory:
-            serializer = ShopCategorySerializer(shopcategory, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(shopcategory, request, view=self)
+        serializer = ShopCategorySerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ShopNewCategoryView(APIView):
@@ -125,7 +142,9 @@ class ShopCategoryDetailView(APIView):
 
     def get(self, request, id):
         shopcategory = self.get_object(id)
-        serializer = ShopCategorySerializer(shopcategory)
+        fields, expand = sparse_fields(request)
+        serializer = ShopCategorySerializer(
+            shopcategory, fields=fields, expand=expand)
         return Response(serializer.data)
 
     def put(self, request, id):
@@ -144,33 +163,111 @@ class ProductListView(APIView):
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, shop_id):
-        product = Product.objects.filter(
-            shop=shop_id).order_by('-id')
+        params = ProductFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = params.validated_data
+        product = Product.objects.filter(shop=shop_id)
+        if 'category' in filters:
+            product = product.filter(shopcategory=filters['category'])
+        if filters['is_active'] is not None:
+            product = product.filter(is_active=filters['is_active'])
+        if 'min_price' in filters:
+            product = product.filter(price__gte=filters['min_price'])
+        if 'max_price' in filters:
+            product = product.filter(price__lte=filters['max_price'])
+
+        fields, expand = sparse_fields(request)
+        product = ProductSerializer.optimize_queryset(product, fields, expand)
+
+        paginator = KeysetCursorPagination()
+        paginator.ordering = ProductFilterSerializer.ORDERINGS[filters['sort']]
+        page = paginator.paginate_queryset(product, request, view=self)
+        serializer = ProductSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ProductSearchView(APIView):
+    """
+    Text search over product name/description across active shops,
+    optionally narrowed to a country id or a shop category slug.
+    """
 
-        if product:
-            serializer = ProductSerializer(product, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+    def get(self, request):
+        params = ProductSearchSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        product = Product.objects.filter(is_active=True, shop__is_active=True)
+        if 'country' in params.validated_data:
+            product = product.filter(
+                shop__user__country=params.validated_data['country'])
+        if 'category' in params.validated_data:
+            product = product.filter(
+                shopcategory__slug=params.validated_data['category'])
+        product = get_search_backend().filter(
+            product, params.validated_data['q'])
+
+        fields, expand = sparse_fields(request)
+        product = ProductSerializer.optimize_queryset(product, fields, expand)
+
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(product, request, view=self)
+        serializer = ProductSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ShopAndProductsView(APIView):
+    """
+    Public storefront. The rendered JSON is kept as a snapshot in
+    `storefronts` and dropped by the Shop/Product/Merchant/Country
+    signals, so steady state reads never reach the database.
+    """
 
     def get_object(self, shop_slug):
         try:
-            return Shop.objects.get(sub_domain=shop_slug)
+            return Shop.objects.select_related('user__country')\
+                .prefetch_related('products').get(sub_domain=shop_slug)
 
         except Shop.DoesNotExist:
             # return HttpResponse(status=status.HTTP_404_NOT_FOUND)
             raise Http404
 
-    def get(self, request, shop_slug):
+    def get_snapshot(self, shop_slug):
         shop = self.get_object(shop_slug)
         serializer = ShopAndProductsSerializer(shop)
-        return Response(serializer.data)
+        body = JSONRenderer().render(serializer.data)
+        return {
+            "etag": '"%s"' % hashlib.md5(body).hexdigest(),
+            "body": body
+        }
+
+    def get(self, request, shop_slug):
+        snapshot = storefronts.get_or_set(
+            shop_slug, lambda: self.get_snapshot(shop_slug))
+
+        if snapshot['etag'] in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                snapshot['body'], content_type='application/json')
+        response['ETag'] = snapshot['etag']
+        return response
+
+
+class HostShopAndProductsView(ShopAndProductsView):
+    """
+    Storefront of the shop the request's host resolves to, see
+    jumga.middleware.ShopHostMiddleware.
+    """
+
+    def get(self, request):
+        if request.shop_sub_domain is None:
+            raise Http404
+        return super().get(request, request.shop_sub_domain)
 
 
 class ProductNewView(APIView):
@@ -187,6 +284,78 @@ class ProductNewView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ProductImportView(APIView):
+    """
+    Bulk creates products for a shop from an uploaded CSV or NDJSON
+    `file`. The type is taken from `type` or the file extension. A file
+    that isn't UTF-8 gets a 400 naming the line it breaks at, the rows
+    before it are still imported.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, shop_id):
+        shop = get_object_or_404(Shop, id=shop_id)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            err = {"file": ["No file was submitted."]}
+            return Response(err, status=status.HTTP_400_BAD_REQUEST)
+
+        type = request.data.get('type') or detect_type(upload.name)
+        report = ProductImporter(shop).run(read_rows(upload.file, type))
+
+        if report['created'] and 'file' not in report:
+            return Response(report, status=status.HTTP_201_CREATED)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ProductBulkUpdateView(APIView):
+    """
+    Changes price (by percentage), activity or category of many products
+    of a shop in one set based UPDATE. Slugs are left untouched.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def patch(self, request, shop_id):
+        shop = get_object_or_404(Shop, id=shop_id)
+        serializer = ProductBulkUpdateSerializer(
+            data=request.data, context={'shop': shop})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        product = Product.objects.filter(shop=shop)
+        if 'ids' in data:
+            product = product.filter(id__in=data['ids'])
+        filters = data.get('filters', {})
+        if 'shopcategory' in filters:
+            product = product.filter(shopcategory=filters['shopcategory'])
+        if 'is_active' in filters:
+            product = product.filter(is_active=filters['is_active'])
+
+        changes = data['changes']
+        fields = {"updated_at": timezone.now()}
+        if 'price_percent' in changes:
+            factor = 1 + changes['price_percent'] / 100
+            fields['price'] = Round(ExpressionWrapper(
+                F('price') * Value(factor), output_field=DecimalField()))
+        if 'is_active' in changes:
+            fields['is_active'] = changes['is_active']
+        if 'shopcategory' in changes:
+            fields['shopcategory'] = changes['shopcategory']
+
+        updated = product.update(**fields)
+        if updated:
+            invalidate_storefronts(shop.sub_domain)
+            if 'ids' in data:
+                invalidate_product_prices(shop.id, *data['ids'])
+            else:
+                invalidate_shop_prices(shop.id)
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+
 class ProductDetailView(APIView):
 
     def get_object(self, id):
@@ -199,7 +368,8 @@ class ProductDetailView(APIView):
 
     def get(self, request, id):
         product = self.get_object(id)
-        serializer = ProductSerializer(product)
+        fields, expand = sparse_fields(request)
+        serializer = ProductSerializer(product, fields=fields, expand=expand)
         return Response(serializer.data)
 
     def put(self, request, id):
@@ -211,6 +381,91 @@ class ProductDetailView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# DIRECT MEDIA UPLOADS
+
+class UploadURLView(APIView):
+    """
+    Issues a presigned post so the client uploads an image straight to
+    the media bucket, then attaches it with UploadConfirmView.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = issue_upload(**serializer.validated_data)
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+
+class UploadConfirmView(APIView):
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    serializers = {
+        Shop: ShopSerializer,
+        Product: ProductSerializer,
+    }
+
+    def post(self, request):
+        serializer = UploadConfirmSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            target, key = read_upload_token(
+                serializer.validated_data['upload_token'])
+        except signing.BadSignature:
+            err = {"upload_token": ["Invalid or expired upload token."]}
+            return Response(err, status=status.HTTP_400_BAD_REQUEST)
+
+        model, field = UPLOAD_TARGETS[target]
+        instance = get_object_or_404(model, id=serializer.validated_data['id'])
+
+        if not default_storage.exists(key):
+            err = {"upload_token": ["The file has not been uploaded yet."]}
+            return Response(err, status=status.HTTP_400_BAD_REQUEST)
+
+        # A plain UPDATE, save() would give a product a new slug and run
+        # every post_save receiver just to attach a file.
+        setattr(instance, field, key)
+        instance.updated_at = timezone.now()
+        model.objects.filter(pk=instance.pk).update(
+            **{field: key, 'updated_at': instance.updated_at})
+        schedule_image_derivatives(instance, field)
+        shop_id = instance.id if model is Shop else instance.shop_id
+        invalidate_storefronts(*Shop.objects.filter(
+            id=shop_id).values_list('sub_domain', flat=True))
+        return Response(self.serializers[model](instance).data)
+
+
+class LocalMediaUploadView(APIView):
+    """
+    Receives presigned posts when media lives on the local filesystem
+    (jumga.storage_backends.LocalMediaStorage).
+    """
+    authentication_classes = []
+
+    def post(self, request):
+        if not hasattr(default_storage, 'check_presigned_post'):
+            raise Http404
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            err = {"file": ["No file was submitted."]}
+            return Response(err, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            key = default_storage.check_presigned_post(request.data, upload)
+        except (signing.BadSignature, ValueError, KeyError):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        default_storage.save(key, upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # Payment AND Transaction
 
 
@@ -218,6 +473,7 @@ class PaymentView(APIView):
     # authentication_classes = [TokenAuthentication]
     # permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = PaymentSerializer(data=request.data)
 
@@ -228,21 +484,106 @@ class PaymentView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class FlutterwaveWebhookView(APIView):
+    """
+    Payment events pushed by Flutterwave. The verif-hash header is the
+    only credential; accepted events are stored and answered right
+    away, the payments are created by the worker.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        if not verify_signature(request):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+        event = event_from_payload(request.data)
+        if event is None:
+            err = {"data": ["A transaction id and flw_ref are required."]}
+            return Response(err, status=status.HTTP_400_BAD_REQUEST)
+
+        receive(event)
+        return Response(status=status.HTTP_200_OK)
+
+
 class MerchantOrdersView(APIView):
     # authentication_classes = [TokenAuthentication]
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, id):
-        orders = Order.objects.filter(shop__user__user__id=id).order_by('-id')
+        fields, expand = sparse_fields(request)
+        orders = MerchantOrdersSerializer.optimize_queryset(
+            Order.objects.filter(shop__user__user__id=id), fields, expand)
+
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = MerchantOrdersSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class OrderStatusTransitionView(APIView):
+    """
+    Moves many of a merchant's orders to delivered or cancelled at once.
+    Orders whose current status doesn't allow it (see
+    Order.TRANSITIONS), or that aren't the merchant's, are reported back
+    as rejected.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
 
-        if orders:
-            serializer = MerchantOrdersSerializer(orders, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+    def patch(self, request, id):
+        serializer = OrderStatusTransitionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updated, rejected = transition_orders(
+            Order.objects.filter(shop__user__user__id=id),
+            serializer.validated_data['ids'],
+            serializer.validated_data['status'])
+        return Response({"updated": updated, "rejected": rejected},
+                        status=status.HTTP_200_OK)
+
+
+class RiderOrderStatusTransitionView(APIView):
+    """
+    Marks many orders of the shops a rider delivers for as delivered.
+    Orders that can't be delivered yet, or aren't the rider's, are
+    reported back as rejected.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def patch(self, request, id):
+        serializer = RiderOrderStatusTransitionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updated, rejected = transition_orders(
+            Order.objects.filter(shop__rider__user__id=id),
+            serializer.validated_data['ids'],
+            serializer.validated_data['status'])
+        return Response({"updated": updated, "rejected": rejected},
+                        status=status.HTTP_200_OK)
+
+
+class MerchantOrdersExportView(APIView):
+    """
+    Streams every order of a merchant as CSV or NDJSON
+    (?type=csv|ndjson, ?gzip=true).
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, id):
+        params = ExportSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = Order.objects.filter(shop__user__user__id=id)
+        return export_response(
+            orders, ORDER_COLUMNS, 'orders',
+            params.validated_data['type'], params.validated_data['gzip'])
 
 
 class CustomersOrderView(APIView):
@@ -250,17 +591,17 @@ class CustomersOrderView(APIView):
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, email, contact):
-        orders = Order.objects.filter(
-            customer_email=email, customer_contact=contact).order_by('-id')
+        fields, expand = sparse_fields(request)
+        orders = CustomerOrdersSerializer.optimize_queryset(
+            Order.objects.filter(
+                lookup_key=customer_lookup_key(email, contact)),
+            fields, expand)
 
-        if orders:
-            serializer = CustomerOrdersSerializer(orders, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = CustomerOrdersSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class AllOrdersView(APIView):
@@ -268,22 +609,44 @@ class AllOrdersView(APIView):
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        orders = Order.objects.all().order_by('-id')
+        fields, expand = sparse_fields(request)
+        orders = MerchantOrdersSerializer.optimize_queryset(
+            Order.objects.all(), fields, expand)
+
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = MerchantOrdersSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class CartQuoteView(APIView):
+    """
+    Prices a cart the way checkout will, without creating anything.
+    Prices come from the shop's cached price list, so re-quoting a cart
+    on every change doesn't reach the database.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
 
-        if orders:
-            serializer = MerchantOrdersSerializer(orders, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+    def post(self, request):
+        serializer = CartQuoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        quote = quote_cart(serializer.validated_data['shop'],
+                           serializer.validated_data['cart'])
+        if quote is None:
+            err = {"shop": ["Invalid shop."]}
+            return Response(err, status=status.HTTP_400_BAD_REQUEST)
+        return Response(quote, status=status.HTTP_200_OK)
 
 
 class OrderView(APIView):
     # authentication_classes = [TokenAuthentication]
     # permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = OrderSerializer(data=request.data)
 
@@ -299,16 +662,109 @@ class TransactionView(APIView):
     # permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        transaction = Transaction.objects.all().order_by('-id')
+        fields, expand = sparse_fields(request)
+        transaction = TransactionSerializer.optimize_queryset(
+            Transaction.objects.all(), fields, expand)
 
-        if transaction:
-            serializer = TransactionSerializer(transaction, many=True)
-            return Response(serializer.data)
-        else:
-            # err = {"error": "not found", "status":404}
-            # return response.Response(err, status.HTTP_404_NOT_FOUND)
-            err = []
-            return response.Response(err, status.HTTP_200_OK)
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(transaction, request, view=self)
+        serializer = TransactionSerializer(
+            page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class TransactionExportView(APIView):
+    """
+    Streams the whole ledger as CSV or NDJSON (?type=csv|ndjson, ?gzip=true).
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = ExportSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return export_response(
+            Transaction.objects.all(), TRANSACTION_COLUMNS, 'transactions',
+            params.validated_data['type'], params.validated_data['gzip'])
+
+
+class ArchivedTransactionsView(APIView):
+    """
+    Months of ledger history that were archived out of the database.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        archives = ArchivedPartition.objects.filter(table_name='transaction')
+
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(archives, request, view=self)
+        serializer = ArchivedPartitionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ArchivedTransactionsDetailView(APIView):
+    """
+    Streams one archived month back as NDJSON, read from the archive
+    file on demand. ?beneficiary=<user id> keeps one user's rows.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, id):
+        archive = get_object_or_404(
+            ArchivedPartition, id=id, table_name='transaction')
+        beneficiary = request.query_params.get('beneficiary')
+
+        rows = read_archive(archive)
+        if beneficiary:
+            rows = (row for row in rows
+                    if str(row['beneficiary_id']).replace('-', '') ==
+                    beneficiary.replace('-', ''))
+        lines = (json.dumps(row) + '\n' for row in rows)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+class BalanceView(APIView):
+    """
+    A user's account balance in their own currency, and credits, debits
+    and balance per currency from the daily ledger rollups. Users without
+    a merchant or rider country have no account_currency and only the
+    per-currency figures count for them.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, id):
+        user = get_object_or_404(User.objects.only('id', 'account_balance'), id=id)
+        return Response({
+            "account_balance": user.account_balance,
+            "account_currency": balance_currencies([user.id]).get(user.id),
+            "currencies": balances(user.id),
+        }, status=status.HTTP_200_OK)
+
+
+class StatementView(APIView):
+    """
+    A user's ledger totals per day and currency, ?since=YYYY-MM-DD and
+    ?until=YYYY-MM-DD inclusive.
+    """
+    # authentication_classes = [TokenAuthentication]
+    # permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, id):
+        params = StatementQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = get_object_or_404(User.objects.only('id'), id=id)
+        days = statement(user.id, params.validated_data.get('since'),
+                         params.validated_data.get('until'))
+        serializer = StatementDaySerializer(days, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class OverviewView(APIView):
@@ -0,0 +1,216 @@
+"""
+Flutterwave payment webhooks.
+
+The endpoint does as little as possible: it checks the verif-hash
+header and inserts the event into the WebhookEvent inbox, where the
+unique transaction_id and flw_ref make redeliveries a no-op. Payments
+are created from the inbox in batches by drain_inbox, on the worker.
+"""
+import hmac
+import logging
+from decimal import Decimal as D, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LedgerOutbox, Order, Payment, Shop, WebhookEvent
+from .tasks import WEBHOOK_INBOX_KEY, process_ledger_outbox, process_webhook_events
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'verif-hash'
+
+SUCCESSFUL = 'successful'
+
+BATCH_SIZE = 500
+
+REFERENCE_LENGTH = 128
+
+# Payment.amount holds 18 digits, 2 of them decimals
+MAX_AMOUNT = D(10) ** 16
+
+
+def verify_signature(request):
+    secret = settings.FLUTTERWAVE_SECRET_HASH
+    signature = request.headers.get(SIGNATURE_HEADER, '')
+    return bool(secret) and hmac.compare_digest(signature.encode(), secret.encode())
+
+
+def event_from_payload(payload):
+    """
+    The inbox row of a webhook body, or None when it lacks the
+    references we dedup on.
+    """
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        return None
+
+    transaction_id = str(data.get('id') or '')
+    flw_ref = str(data.get('flw_ref') or '')
+    if not transaction_id or not flw_ref or \
+            max(len(transaction_id), len(flw_ref)) > REFERENCE_LENGTH:
+        return None
+
+    return WebhookEvent(
+        event=str(payload.get('event') or '')[:64],
+        transaction_id=transaction_id, flw_ref=flw_ref, payload=payload)
+
+
+def receive(event):
+    """
+    Stores the event with a single insert, ignoring redeliveries, and
+    makes sure a batch is coming to process it.
+    """
+    WebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
+    transaction.on_commit(schedule_inbox)
+
+
+def schedule_inbox():
+    """
+    Schedules one batch per WEBHOOK_BATCH_DELAY, however many events
+    arrive in the meantime.
+    """
+    delay = settings.WEBHOOK_BATCH_DELAY
+    if cache.add(WEBHOOK_INBOX_KEY, 1, delay + 60):
+        process_webhook_events.apply_async(countdown=delay)
+
+
+def charge(event):
+    """
+    (data, meta) of the charge an event reports.
+    """
+    data = event.payload.get('data') or {}
+    meta = data.get('meta') or event.payload.get('meta_data') or {}
+    return data, meta if isinstance(meta, dict) else {}
+
+
+def build_payment(event, orders, references, shops):
+    """
+    The Payment an event stands for, or (None, reason) when it doesn't
+    make one.
+    """
+    data, meta = charge(event)
+    if data.get('status') != SUCCESSFUL:
+        return None, 'Charge status is %s.' % data.get('status')
+    currency = data.get('currency')
+    if not isinstance(currency, str) or currency not in dict(Payment.CURRENCY):
+        return None, 'Unsupported currency %s.' % currency
+    try:
+        amount = D(str(data.get('amount')))
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite() or not 0 < amount < MAX_AMOUNT:
+        return None, 'Invalid amount %s.' % data.get('amount')
+    amount = amount.quantize(D('0.01'))
+
+    tx_ref = str(data.get('tx_ref') or '')[:REFERENCE_LENGTH]
+    order = orders.get(str(meta.get('order'))) or references.get(tx_ref)
+    payment_type = meta.get('payment_type') or (Payment.SALE if order else None)
+
+    if payment_type == Payment.SALE:
+        if order is None:
+            return None, 'Unknown order.'
+        if amount < order.total:
+            return None, 'Amount %s is less than the order total %s.' % (amount, order.total)
+        shop = order.shop
+    elif payment_type == Payment.APPROVAL:
+        order = None
+        shop = shops.get(str(meta.get('shop')))
+        if shop is None:
+            return None, 'Unknown shop.'
+    else:
+        return None, 'Unknown payment type %s.' % payment_type
+
+    return Payment(
+        amount=amount, currency=currency, status=data['status'],
+        flw_ref=event.flw_ref, transaction_id=event.transaction_id,
+        tx_ref=tx_ref or event.flw_ref, payment_type=payment_type,
+        order=order, shop=shop, merchant_id=shop.user_id,
+        narration=str(data.get('narration') or '')[:256]), ''
+
+
+def related_objects(events):
+    """
+    Orders by id and by reference, and shops by id, of a batch of events,
+    three queries whatever the batch size.
+    """
+    order_ids, references, shop_ids = set(), set(), set()
+    for event in events:
+        data, meta = charge(event)
+        if str(meta.get('order') or '').isdigit():
+            order_ids.add(int(meta['order']))
+        if data.get('tx_ref'):
+            references.add(str(data['tx_ref']))
+        if str(meta.get('shop') or '').isdigit():
+            shop_ids.add(int(meta['shop']))
+
+    orders = Order.objects.select_related('shop')
+    return (
+        {str(order.id): order for order in orders.filter(id__in=order_ids)},
+        {order.reference_id: order for order in orders.filter(reference_id__in=references)},
+        {str(shop.id): shop for shop in Shop.objects.filter(id__in=shop_ids)},
+    )
+
+
+def drain_inbox(batch_size=BATCH_SIZE):
+    """
+    Turns one batch of inbox events into payments: one bulk insert for
+    the payments, one for their ledger outbox rows. Events that don't
+    make a payment are marked processed with the reason. Returns
+    (payments created, events skipped).
+    """
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(processed_at__isnull=True).order_by('id')[:batch_size])
+        if not events:
+            return 0, 0
+
+        orders, references, shops = related_objects(events)
+        payments = {}
+        for event in events:
+            try:
+                payment, event.error = build_payment(event, orders, references, shops)
+            except Exception as exc:
+                logger.exception('Webhook event %s could not be processed', event.id)
+                payment, event.error = None, repr(exc)
+            if payment is not None:
+                payments[event.transaction_id] = payment
+
+        # Payments already posted by PaymentView are kept as they are
+        Payment.objects.bulk_create(payments.values(), ignore_conflicts=True)
+        ids = dict(Payment.objects.filter(transaction_id__in=payments)
+                   .values_list('transaction_id', 'id'))
+        LedgerOutbox.objects.bulk_create(
+            [LedgerOutbox(payment_id=id) for id in ids.values()],
+            ignore_conflicts=True)
+
+        now = timezone.now()
+        for event in events:
+            event.processed_at = now
+            event.payment_id = ids.get(event.transaction_id)
+            if event.transaction_id in payments and event.payment_id is None:
+                event.error = 'A payment with tx_ref %s already exists.' % \
+                    payments[event.transaction_id].tx_ref
+        WebhookEvent.objects.bulk_update(
+            events, ['payment', 'error', 'processed_at'])
+
+        if ids:
+            transaction.on_commit(lambda: process_ledger_outbox.delay())
+    skipped = sum(1 for event in events if event.payment_id is None)
+    return len(events) - skipped, skipped
+
+
+def drain(batch_size=BATCH_SIZE):
+    """
+    Drains batches until the inbox is empty.
+    """
+    total_created = total_skipped = 0
+    while True:
+        created, skipped = drain_inbox(batch_size)
+        if not created and not skipped:
+            return total_created, total_skipped
+        total_created += created
+        total_skipped += skipped
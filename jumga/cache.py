@@ -0,0 +1,147 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache as shared_cache
+
+
+class LRUCache:
+    """
+    Small thread safe, size bounded in-process cache.
+
+    Entries also carry an expiry so that a worker never serves a value
+    longer than ``ttl`` seconds after another process invalidated it.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """
+    In-process LRU in front of the shared Django cache.
+
+    Reads try the local LRU, then the shared cache; ``delete`` drops the
+    key from both so the next read in any worker goes back to the source.
+
+    ``delete`` also stamps a new version on the key. ``get_or_set`` only
+    stores what it built if the version didn't change meanwhile, so a
+    reader that loaded rows before a write committed can't put back the
+    snapshot the write just invalidated. Shared entries still expire
+    after ``timeout`` seconds to bound whatever slips past that check.
+    """
+
+    def __init__(self, prefix, maxsize=1024, local_ttl=5, timeout=300):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = LRUCache(maxsize=maxsize, ttl=local_ttl)
+
+    def make_key(self, key):
+        return '%s:%s' % (self.prefix, key)
+
+    def make_version_key(self, key):
+        return '%s:version:%s' % (self.prefix, key)
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        value = shared_cache.get(self.make_key(key))
+        if value is None:
+            return default
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        shared_cache.set(self.make_key(key), value, self.timeout)
+        self.local.set(key, value)
+
+    def get_many(self, keys):
+        """
+        {key: value} of the keys found, with a single shared cache round
+        trip for those missing locally.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared = shared_cache.get_many([self.make_key(key) for key in missing])
+            for key in missing:
+                value = shared.get(self.make_key(key))
+                if value is not None:
+                    self.local.set(key, value)
+                    found[key] = value
+        return found
+
+    def set_many(self, mapping):
+        shared_cache.set_many(
+            {self.make_key(key): value for key, value in mapping.items()}, self.timeout)
+        for key, value in mapping.items():
+            self.local.set(key, value)
+
+    def delete(self, *keys):
+        keys = [key for key in keys if key is not None]
+        for key in keys:
+            self.local.delete(key)
+        if keys:
+            version = uuid.uuid4().hex
+            shared_cache.set_many(
+                {self.make_version_key(key): version for key in keys}, self.timeout)
+            shared_cache.delete_many([self.make_key(key) for key in keys])
+
+    def get_or_set(self, key, default):
+        """
+        Returns the cached value, calling ``default()`` to build and
+        store it on a miss. The built value isn't stored if the key was
+        deleted while it was being built.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        version_key = self.make_version_key(key)
+        shared = shared_cache.get_many([self.make_key(key), version_key])
+        value = shared.get(self.make_key(key))
+        if value is not None:
+            self.local.set(key, value)
+            return value
+        value = default()
+        if value is not None and shared_cache.get(version_key) == shared.get(version_key):
+            self.set(key, value)
+        return value
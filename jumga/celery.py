@@ -0,0 +1,14 @@
+import os
+
+from celery import Celery
+from decouple import config
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                      config('DJANGO_SETTINGS_MODULE'))
+
+app = Celery('jumga')
+
+# All celery settings live in the django settings, prefixed with CELERY_
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+app.autodiscover_tasks()
@@ -0,0 +1,191 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# How long a request may hold a key before a retry is allowed to take
+# over, in case the worker that had it died.
+LOCK_TIMEOUT = 60
+
+# Returned by begin() while another request with the key is running.
+IN_FLIGHT = object()
+
+
+class CacheBackend:
+    """
+    Keeps responses in the shared Django cache, which evicts them after
+    IDEMPOTENCY_TTL. A replay never touches the database.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def make_key(self, key):
+        return 'idempotency:%s' % key
+
+    def lock_key(self, key):
+        return 'idempotency-lock:%s' % key
+
+    def begin(self, key, fingerprint):
+        stored = cache.get(self.make_key(key))
+        if stored is not None:
+            return stored
+        if not cache.add(self.lock_key(key), fingerprint, LOCK_TIMEOUT):
+            return IN_FLIGHT
+        # The first request may have finished between the two calls above
+        stored = cache.get(self.make_key(key))
+        if stored is not None:
+            cache.delete(self.lock_key(key))
+        return stored
+
+    def store(self, key, fingerprint, status_code, content):
+        cache.set(self.make_key(key), {
+            'fingerprint': fingerprint,
+            'status_code': status_code,
+            'content': content,
+        }, self.ttl)
+        cache.delete(self.lock_key(key))
+
+    def release(self, key):
+        cache.delete(self.lock_key(key))
+
+
+class DatabaseBackend:
+    """
+    Keeps responses in the api.IdempotencyKey table, for deployments
+    where the cache is not shared or not durable enough. The unique key
+    column serialises concurrent requests; expired rows are replaced
+    when their key comes back and purged by purge_idempotency_keys.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    @property
+    def model(self):
+        from jumga.apps.api.models import IdempotencyKey
+        return IdempotencyKey
+
+    def begin(self, key, fingerprint):
+        row = self.model.objects.filter(key=key).first()
+        if row is not None and not self.expired(row):
+            return self.stored(row)
+        if row is not None:
+            self.model.objects.filter(pk=row.pk).delete()
+
+        try:
+            with transaction.atomic():
+                self.model.objects.create(key=key, fingerprint=fingerprint)
+            return None
+        except IntegrityError:
+            # Another request took the key since we looked
+            return IN_FLIGHT
+
+    def expired(self, row):
+        age = timezone.now() - row.created_at
+        if row.status_code is None:
+            return age > timedelta(seconds=LOCK_TIMEOUT)
+        return age > timedelta(seconds=self.ttl)
+
+    def stored(self, row):
+        if row.status_code is None:
+            return IN_FLIGHT
+        return {
+            'fingerprint': row.fingerprint,
+            'status_code': row.status_code,
+            'content': row.content,
+        }
+
+    def store(self, key, fingerprint, status_code, content):
+        self.model.objects.filter(key=key).update(
+            status_code=status_code, content=content)
+
+    def release(self, key):
+        self.model.objects.filter(key=key, status_code__isnull=True).delete()
+
+    def purge(self):
+        return self.model.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+        ).delete()[0]
+
+
+BACKENDS = {
+    'cache': CacheBackend,
+    'database': DatabaseBackend,
+}
+
+
+def get_backend():
+    return BACKENDS[settings.IDEMPOTENCY_BACKEND](settings.IDEMPOTENCY_TTL)
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(method):
+    """
+    Makes a POST handler safe to retry. The first response for an
+    Idempotency-Key is stored and replayed to every retry with the same
+    key; a retry that arrives while the first request is still running
+    gets a 409, and reusing a key for a different body gets a 422.
+    Requests without the header are handled as before.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': _('%s is too long.') % HEADER},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        key = '%s:%s' % (type(self).__name__, key)
+        digest = fingerprint(request)
+        backend = get_backend()
+
+        stored = backend.begin(key, digest)
+        if stored is IN_FLIGHT:
+            return Response(
+                {'detail': _('A request with this %s is in progress.') % HEADER},
+                status=status.HTTP_409_CONFLICT)
+        if stored is not None:
+            if stored['fingerprint'] != digest:
+                return Response(
+                    {'detail': _('%s was already used for a different request.') % HEADER},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            response = HttpResponse(
+                stored['content'], status=stored['status_code'],
+                content_type='application/json')
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = method(self, request, *args, **kwargs)
+        except Exception:
+            backend.release(key)
+            raise
+
+        if response.status_code >= 500:
+            backend.release(key)
+        else:
+            backend.store(key, digest, response.status_code,
+                          JSONRenderer().render(response.data).decode())
+        return response
+
+    return wrapper
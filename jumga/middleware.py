@@ -0,0 +1,50 @@
+from django.conf import settings
+
+from jumga.apps.merchant.cache import shop_hosts
+from jumga.apps.merchant.models import Shop
+
+
+def resolve_shop_id(sub_domain):
+    return Shop.objects.filter(
+        sub_domain=sub_domain).values_list('id', flat=True).first() or 0
+
+
+class ShopHostMiddleware:
+    """
+    Resolves `<sub_domain>.<SHOP_ROOT_DOMAIN>` hosts to the shop they
+    belong to and sets `request.shop_id` / `request.shop_sub_domain`
+    (None for any other host or an unknown shop).
+
+    Lookups go through the in-process LRU and the shared cache, so only
+    a cold sub_domain costs a (unique index) query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        root = settings.SHOP_ROOT_DOMAIN.lower().strip('.')
+        self.suffix = '.' + root if root else None
+
+    def __call__(self, request):
+        request.shop_id = None
+        request.shop_sub_domain = None
+
+        sub_domain = self.get_sub_domain(request)
+        if sub_domain:
+            shop_id = shop_hosts.get_or_set(
+                sub_domain, lambda: resolve_shop_id(sub_domain))
+            if shop_id:
+                request.shop_id = shop_id
+                request.shop_sub_domain = sub_domain
+
+        return self.get_response(request)
+
+    def get_sub_domain(self, request):
+        if self.suffix is None:
+            return None
+        host = request.get_host().split(':')[0].lower()
+        if not host.endswith(self.suffix):
+            return None
+        sub_domain = host[:-len(self.suffix)]
+        if not sub_domain or '.' in sub_domain:
+            return None
+        return sub_domain
@@ -0,0 +1,121 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Opaque cursor pagination keyed on the primary key, newest first.
+
+    Every page is a ``WHERE id < <cursor> ORDER BY id DESC LIMIT n``
+    probe on the primary key index, so the cost of a page does not
+    grow with the size of the table (no COUNT, no OFFSET).
+    """
+    ordering = '-id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetCursorPagination(IdCursorPagination):
+    """
+    Cursor pagination over a compound ordering such as ``('price', 'id')``.
+
+    CursorPagination only keeps the first field of the ordering in the
+    cursor and pages through rows sharing its value with an OFFSET.
+    Here the cursor holds every field of the ordering and each page is
+    a ``WHERE (price, id) > (%s, %s)`` row comparison, which an index
+    over the same columns answers without skipping rows. The last field
+    must be unique and every field must be ordered the same way.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset, filtering on the whole
+        # position instead of the first field.
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = self.filter_position(queryset, current_position, reverse)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def filter_position(self, queryset, position, reverse):
+        opts = queryset.model._meta
+        fields = [opts.get_field(order.lstrip('-')) for order in self.ordering]
+        descending = {order.startswith('-') for order in self.ordering}
+        assert len(descending) == 1, (
+            'Keyset pagination needs every field of the ordering in the same direction.')
+
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        quote = connections[queryset.db].ops.quote_name
+        columns = ', '.join('%s.%s' % (quote(opts.db_table), quote(field.column))
+                            for field in fields)
+        operator = '<' if reverse != descending.pop() else '>'
+        return queryset.extra(
+            where=['(%s) %s (%s)' % (columns, operator, ', '.join(['%s'] * len(values)))],
+            params=values)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            name = order.lstrip('-')
+            if isinstance(instance, dict):
+                values.append(str(instance[name]))
+            else:
+                values.append(str(getattr(instance, name)))
+        return json.dumps(values)
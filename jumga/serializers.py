@@ -0,0 +1,83 @@
+def sparse_fields(request):
+    """
+    Returns the (fields, expand) lists asked for with ?fields=a,b and
+    ?expand=c. `fields` is None when the client wants every field.
+    """
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    return (
+        [name for name in fields.split(',') if name] if fields else None,
+        [name for name in expand.split(',') if name] if expand else [],
+    )
+
+
+class DynamicFieldsMixin:
+    """
+    Lets clients trim and grow a serializer's output.
+
+    * `fields=[...]` keeps only the listed fields.
+    * `expand=[...]` swaps relations listed in `Meta.expandable`
+      (name -> (serializer class, select_related paths)) for the nested
+      serializer instead of the related id.
+
+    `optimize_queryset` loads only what the chosen fields need: the
+    `Meta.select_related` / `Meta.prefetch_related` paths declared per
+    field, and only() over the concrete columns when every requested
+    field maps to a column or a declared relation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None) or ()
+        super().__init__(*args, **kwargs)
+
+        expandable = getattr(self.Meta, 'expandable', {})
+        for name in expand:
+            if name in expandable and name in self.fields:
+                serializer_class, _ = expandable[name]
+                self.fields[name] = serializer_class(read_only=True)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, expand=()):
+        meta = cls.Meta
+        select = getattr(meta, 'select_related', {})
+        prefetch = getattr(meta, 'prefetch_related', {})
+        expandable = getattr(meta, 'expandable', {})
+
+        names = [name for name in meta.fields
+                 if fields is None or name in fields]
+
+        related = set()
+        for name in names:
+            if name in expand and name in expandable:
+                related.update(expandable[name][1])
+            related.update(select.get(name, ()))
+            if name in prefetch:
+                queryset = queryset.prefetch_related(*prefetch[name])
+        if related:
+            queryset = queryset.select_related(*related)
+
+        if fields is None:
+            return queryset
+
+        opts = meta.model._meta
+        concrete = {field.name for field in opts.concrete_fields}
+        columns = {opts.pk.name}
+        for name in names:
+            declared = cls._declared_fields.get(name)
+            source = declared.source if declared and declared.source else name
+            if source in concrete:
+                columns.add(source)
+            elif name in select or name in prefetch:
+                columns.update(path.split('__')[0] for path in select.get(name, ())
+                               if path.split('__')[0] in concrete)
+            else:
+                # Computed from something we don't know about, load it all
+                return queryset
+        columns.update(path.split('__')[0] for path in related
+                       if path.split('__')[0] in concrete)
+        return queryset.only(*columns)
@@ -34,6 +34,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'jumga.middleware.ShopHostMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS MIDDLEWARE
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -43,6 +44,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'jumga.urls'
 
+# Shops are also served on <sub_domain>.SHOP_ROOT_DOMAIN, remember to
+# allow '.<SHOP_ROOT_DOMAIN>' in ALLOWED_HOSTS.
+SHOP_ROOT_DOMAIN = config('SHOP_ROOT_DOMAIN', default='')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -108,7 +113,52 @@ USE_TZ = True
 
 AUTH_USER_MODEL = 'account.User'
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+EMAIL_BACKEND = config(
+    'EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+
+# Order notifications to a merchant within this many seconds are sent
+# as one digest email.
+NOTIFICATION_DIGEST_DELAY = config(
+    'NOTIFICATION_DIGEST_DELAY', default=60, cast=int)
+
+# Account credited with Jumga's share of every approval and sale.
+JUMGA_PLATFORM_EMAIL = config('JUMGA_PLATFORM_EMAIL', default='jumga@gmail.com')
+
+# How approved shops get their rider, one of jumga.apps.merchant.riders
+# STRATEGIES: 'least_loaded', 'same_country' or 'round_robin'.
+RIDER_ASSIGNMENT_STRATEGY = config(
+    'RIDER_ASSIGNMENT_STRATEGY', default='least_loaded')
+
+# The secret hash set on the Flutterwave dashboard, sent back in the
+# verif-hash header of every webhook. Webhooks are refused while unset.
+FLUTTERWAVE_SECRET_HASH = config('FLUTTERWAVE_SECRET_HASH', default='')
+
+# Webhook events arriving within this many seconds are turned into
+# payments by the same batch.
+WEBHOOK_BATCH_DELAY = config('WEBHOOK_BATCH_DELAY', default=2, cast=int)
+
+# Shared cache for storefront snapshots and lookups. Every worker keeps a
+# small in-process LRU in front of it (see jumga/cache.py).
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='jumga'),
+        'TIMEOUT': None,
+    }
+}
+
+# Celery (background tasks). Set CELERY_TASK_ALWAYS_EAGER to run tasks
+# inline without a broker.
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='amqp://localhost')
+CELERY_TASK_ALWAYS_EAGER = config(
+    'CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -116,6 +166,16 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Idempotency-Key handling for order and payment creation (see
+# jumga/idempotency.py). 'cache' keeps responses in the shared cache,
+# 'database' in the api.IdempotencyKey table.
+IDEMPOTENCY_BACKEND = config('IDEMPOTENCY_BACKEND', default='cache')
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=60 * 60 * 24, cast=int)
+
+# Default page size for the cursor paginated list endpoints,
+# clients can ask for up to 100 with ?page_size=
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=20, cast=int)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=120),
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(minutes=240),
@@ -150,6 +210,8 @@ AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_CUSTOM_DOMAIN = '%s.s3.amazonaws.com' % AWS_STORAGE_BUCKET_NAME
+# Point at an S3 compatible server (e.g. MinIO) instead of AWS
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
 
 AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',
@@ -160,3 +222,7 @@ STATIC_URL = 'https://%s/%s/' % (AWS_S3_CUSTOM_DOMAIN, AWS_LOCATION)
 
 STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 DEFAULT_FILE_STORAGE = 'jumga.storage_backends.MediaStorage'
+
+# Where archive_partitions writes closed ledger partitions
+ARCHIVE_FILE_STORAGE = config(
+    'ARCHIVE_FILE_STORAGE', default='jumga.storage_backends.ArchiveStorage')
@@ -30,3 +30,14 @@ CORS_ALLOWED_ORIGINS = config(
     'CORS_ALLOWED_ORIGINS', cast=Csv(post_process=tuple))
 
 PROJECT_ACCESS_KEY = config('PROJECT_ACCESS_KEY').encode()
+
+# Use DEFAULT_FILE_STORAGE=jumga.storage_backends.LocalMediaStorage to
+# keep media on disk while developing. Tasks run inline unless a broker
+# is configured.
+DEFAULT_FILE_STORAGE = config(
+    'DEFAULT_FILE_STORAGE', default='jumga.storage_backends.MediaStorage')
+MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+MEDIA_URL = '/media/'
+
+CELERY_TASK_ALWAYS_EAGER = config(
+    'CELERY_TASK_ALWAYS_EAGER', default=True, cast=bool)
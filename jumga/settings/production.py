@@ -15,6 +15,14 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.memcached.MemcachedCache'),
+        'LOCATION': config('CACHE_LOCATION', default='127.0.0.1:11211'),
+        'TIMEOUT': None,
+    }
+}
+
 CORS_ALLOWED_ORIGINS = config(
     'CORS_ALLOWED_ORIGINS', cast=Csv(post_process=tuple))
 
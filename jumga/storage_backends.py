@@ -1,6 +1,77 @@
+import time
+
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
 from storages.backends.s3boto3 import S3Boto3Storage
 
+PRESIGNED_POST_SALT = 'jumga.storage_backends.presigned_post'
+
 
 class MediaStorage(S3Boto3Storage):
     location = 'media'
     file_overwrite = False
+
+    def presigned_post(self, name, content_type, max_size, expires_in=900):
+        """
+        Returns the url and form fields a client posts the file to, so it
+        goes straight to the bucket instead of through our workers.
+        """
+        key = self._normalize_name(self._clean_name(name))
+        return self.bucket.meta.client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_size],
+            ],
+            ExpiresIn=expires_in,
+        )
+
+
+class ArchiveStorage(S3Boto3Storage):
+    """
+    Private bucket prefix for archived ledger partitions. Objects are
+    never public and are only read back through the API.
+    """
+    location = 'archive'
+    default_acl = 'private'
+    custom_domain = None
+    file_overwrite = False
+
+
+class LocalMediaStorage(FileSystemStorage):
+    """
+    Filesystem stand-in for MediaStorage while developing. Presigned posts
+    go to LocalMediaUploadView, which checks the signed fields.
+    """
+
+    def presigned_post(self, name, content_type, max_size, expires_in=900):
+        policy = {'key': name, 'content_type': content_type,
+                  'max_size': max_size, 'expires': time.time() + expires_in}
+        return {
+            'url': reverse('media_upload_local'),
+            'fields': {
+                'key': name,
+                'Content-Type': content_type,
+                'policy': signing.dumps(policy, salt=PRESIGNED_POST_SALT),
+            }
+        }
+
+    def check_presigned_post(self, fields, file):
+        """
+        Returns the key a local presigned post may write to, or raises
+        signing.BadSignature / ValueError.
+        """
+        policy = signing.loads(fields.get('policy', ''),
+                               salt=PRESIGNED_POST_SALT)
+        if policy['expires'] < time.time():
+            raise ValueError('the policy has expired')
+        if fields.get('key') != policy['key']:
+            raise ValueError('key does not match the policy')
+        if file.content_type != policy['content_type']:
+            raise ValueError('Content-Type does not match the policy')
+        if not 0 < file.size <= policy['max_size']:
+            raise ValueError('file size is outside of the policy')
+        return policy['key']